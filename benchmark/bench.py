@@ -0,0 +1,262 @@
+import typing
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+from threading import Thread
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "manager"))
+
+import psycopg2  # noqa: E402
+import pod_cache  # noqa: E402
+from fakes import ClusterClosed, FakeCluster, FakePostgres, FakeWatch  # noqa: E402
+from manager import Manager  # noqa: E402
+from config_monitor import ConfigMonitor, PodMonitorConfig  # noqa: E402
+from db import DBHandler  # noqa: E402
+from env_conf import parse_env_vars  # noqa: E402
+from pod_state import NodeSet  # noqa: E402
+
+MASTER_LABEL = "citus-master"
+WORKER_LABEL = "citus-worker"
+SETUP_STATEMENTS = 5
+
+
+class BenchmarkManager(Manager):
+    def start_web_server(self) -> None:
+        pass
+
+    def start_reconcile_loop(self) -> None:
+        pass
+
+    def create_provision_monitor(self) -> ConfigMonitor:
+        monitor = super().create_provision_monitor()
+        setattr(monitor, "start_watchers", lambda: None)
+        return monitor
+
+
+def configure(args: argparse.Namespace) -> FakePostgres:
+    config_dir = tempfile.mkdtemp(prefix="citus-config-")
+    write_setup(os.path.join(config_dir, "master.setup"), "master")
+    write_setup(os.path.join(config_dir, "worker.setup"), "worker")
+    Manager.config_path = config_dir + "/"
+    os.environ.update(
+        {
+            "NAMESPACE": "benchmark",
+            "SHORT_URL": "True",
+            "MINIMUM_WORKERS": str(args.minimum_workers),
+            "MASTER_SETUP_BATCH": "True" if args.batch else "",
+            "WORKER_SETUP_BATCH": "True" if args.batch else "",
+        }
+    )
+    pg = FakePostgres(args.connect_latency, args.query_latency)
+    setattr(psycopg2, "connect", pg.connect)
+    return pg
+
+
+def write_setup(path: str, name: str) -> None:
+    with open(path, "w") as f:
+        for i in range(SETUP_STATEMENTS):
+            f.write("CREATE TABLE {}_{} (id int);\n".format(name, i))
+
+
+def wait_for(condition: typing.Callable[[], bool], timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def bench_manager(args: argparse.Namespace, pg: FakePostgres) -> dict:
+    cluster = FakeCluster(history=args.history)
+    setattr(pod_cache.watch, "Watch", FakeWatch(cluster))
+    manager = BenchmarkManager()
+
+    def watch() -> None:
+        try:
+            manager.watch_pods(cluster.list_namespaced_pod)
+        except ClusterClosed:
+            pass
+
+    masters = ["{}-{}".format(MASTER_LABEL, i) for i in range(args.masters)]
+    workers = ["{}-{}".format(WORKER_LABEL, i) for i in range(args.workers)]
+    master_hosts = [
+        manager.db_handler.get_host_name(m, "pg-citus-master") for m in masters
+    ]
+    for i in range(args.unrelated):
+        cluster.create_pod("app-{}".format(i), "", ready=True)
+
+    def converged(expected: typing.Set[str]) -> bool:
+        return all(pg.registered(host) == expected for host in master_hosts)
+
+    start = time.monotonic()
+    watcher = Thread(target=watch, daemon=True)
+    watcher.start()
+    wait_for(lambda: manager.pod_cache.synced, args.timeout)
+    ready_time = time.monotonic() - start
+    schedule_pods(cluster, masters, MASTER_LABEL, args.readiness_delay)
+    schedule_pods(cluster, workers, WORKER_LABEL, args.readiness_delay)
+    expected = {manager.worker_host(w) for w in workers}
+    scale_up = wait_for(lambda: converged(expected), args.timeout)
+    scale_up_time = time.monotonic() - start
+    totals = pg.totals()
+
+    removed = workers[: args.churn]
+    start_down = time.monotonic()
+    for worker in removed:
+        cluster.delete_pod(worker)
+    expected -= {manager.worker_host(w) for w in removed}
+    scale_down = wait_for(lambda: converged(expected), args.timeout)
+    scale_down_time = time.monotonic() - start_down
+    elapsed = time.monotonic() - start
+
+    cluster.close()
+    watcher.join(5)
+    events = cluster.version
+    final = pg.totals()
+    return {
+        "converged": scale_up and scale_down,
+        "events": events,
+        "events_received": manager.event_stats.received,
+        "events_acted": manager.event_stats.acted,
+        "events_per_sec": round(events / elapsed, 1),
+        "ready_sec": round(ready_time, 3),
+        "converge_scale_up_sec": round(scale_up_time, 3),
+        "converge_scale_down_sec": round(scale_down_time, 3),
+        "connects": final["connects"],
+        "round_trips": final["round_trips"],
+        "round_trips_scale_up": totals["round_trips"],
+        "round_trips_per_event": round(final["round_trips"] / max(1, events), 2),
+    }
+
+
+def schedule_pods(
+    cluster: FakeCluster, names: typing.List[str], label: str, delay: float
+) -> None:
+    for name in names:
+        cluster.create_pod(name, label)
+
+    def make_ready() -> None:
+        pending = sorted((random.uniform(0, delay), name) for name in names)
+        start = time.monotonic()
+        for at, name in pending:
+            time.sleep(max(0.0, start + at - time.monotonic()))
+            cluster.set_ready(name)
+
+    Thread(target=make_ready, daemon=True).start()
+
+
+def bench_db_handler(args: argparse.Namespace, pg: FakePostgres) -> dict:
+    handler = DBHandler(parse_env_vars())
+    hosts = ["{}-{}".format(WORKER_LABEL, i) for i in range(args.workers)]
+    before = pg.totals()
+    queries = args.queries
+
+    def run(offset: int) -> None:
+        for i in range(offset, queries, args.threads):
+            handler.execute_query(hosts[i % len(hosts)], "pg-citus-worker", "SELECT 1")
+
+    start = time.monotonic()
+    threads = [Thread(target=run, args=(i,)) for i in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+    after = pg.totals()
+    return {
+        "queries": queries,
+        "queries_per_sec": round(queries / elapsed, 1),
+        "connects": after["connects"] - before["connects"],
+        "round_trips_per_query": round(
+            (after["round_trips"] - before["round_trips"]) / queries, 2
+        ),
+    }
+
+
+def bench_config_monitor(args: argparse.Namespace, pg: FakePostgres) -> dict:
+    conf = parse_env_vars()
+    handler = DBHandler(conf)
+    workers = NodeSet()
+    workers.update("{}-{}".format(WORKER_LABEL, i) for i in range(args.workers))
+    monitor = ConfigMonitor(
+        handler,
+        PodMonitorConfig(
+            NodeSet(), Manager.config_path + "master.setup", "pg-citus-master"
+        ),
+        PodMonitorConfig(
+            workers,
+            Manager.config_path + "worker.setup",
+            "pg-citus-worker",
+            conf.worker_setup_batch,
+        ),
+        conf.provision_parallelism,
+        conf.provision_timeout,
+    )
+    before = pg.totals()
+    start = time.monotonic()
+    summary = monitor.update_workers()
+    elapsed = time.monotonic() - start
+    after = pg.totals()
+    start = time.monotonic()
+    monitor.update_workers()
+    repeat_elapsed = time.monotonic() - start
+    repeated = pg.totals()
+    return {
+        "nodes": len(workers),
+        "failed": len(summary.failed),
+        "update_sec": round(elapsed, 3),
+        "round_trips_per_node": round(
+            (after["round_trips"] - before["round_trips"]) / max(1, len(workers)), 2
+        ),
+        "repeat_update_sec": round(repeat_elapsed, 3),
+        "repeat_round_trips": repeated["round_trips"] - after["round_trips"],
+    }
+
+
+def parse_args(argv: typing.List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline citus manager benchmark")
+    parser.add_argument("--workers", type=int, default=100)
+    parser.add_argument("--masters", type=int, default=3)
+    parser.add_argument("--unrelated", type=int, default=200)
+    parser.add_argument("--churn", type=int, default=20)
+    parser.add_argument("--minimum-workers", type=int, default=0)
+    parser.add_argument("--readiness-delay", type=float, default=1.0)
+    parser.add_argument("--connect-latency", type=float, default=0.005)
+    parser.add_argument("--query-latency", type=float, default=0.001)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--history", type=int, default=0)
+    parser.add_argument("--batch", action="store_true")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--json", action="store_true")
+    return parser.parse_args(argv)
+
+
+def main(argv: typing.List[str]) -> int:
+    args = parse_args(argv)
+    pg = configure(args)
+    logging.getLogger().setLevel(logging.WARNING)
+    results = {
+        "manager": bench_manager(args, pg),
+        "db_handler": bench_db_handler(args, pg),
+        "config_monitor": bench_config_monitor(args, pg),
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for name, values in results.items():
+            print(name)
+            for key, value in values.items():
+                print("  {:<28} {}".format(key, value))
+    return 0 if results["manager"]["converged"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
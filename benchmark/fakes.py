@@ -0,0 +1,287 @@
+import typing
+import copy
+import re
+import time
+import uuid
+
+from collections import Counter
+from threading import Condition, Lock
+from dataclasses import replace
+from kubernetes.client import (
+    V1ContainerStatus,
+    V1ListMeta,
+    V1ObjectMeta,
+    V1Pod,
+    V1PodList,
+    V1PodStatus,
+)
+
+from leader import LeaseRecord, LeaseStore
+
+SELECTOR = re.compile(r"(\w+) in \(([^)]*)\)")
+NODE = re.compile(r"'([^']*)'(?:, | AND nodeport=)(\d+)")
+
+
+class ClusterClosed(Exception):
+    pass
+
+
+class FakeCluster:
+    def __init__(self, history: int = 0) -> None:
+        self.pods: typing.Dict[str, V1Pod] = {}
+        self.events: typing.List[typing.Tuple[int, dict]] = []
+        self.history = history
+        self.version = 0
+        self.closed = False
+        self.condition = Condition()
+
+    def create_pod(self, name: str, citus_type: str, ready: bool = False) -> None:
+        pod = V1Pod(
+            metadata=V1ObjectMeta(
+                name=name, labels={"citusType": citus_type}, uid=str(uuid.uuid4())
+            ),
+            status=V1PodStatus(container_statuses=[self._container(ready)]),
+        )
+        self._emit("ADDED", name, pod)
+
+    def set_ready(self, name: str, ready: bool = True) -> None:
+        with self.condition:
+            pod = copy.deepcopy(self.pods[name])
+        pod.status.container_statuses = [self._container(ready)]
+        self._emit("MODIFIED", name, pod)
+
+    def delete_pod(self, name: str) -> None:
+        with self.condition:
+            pod = copy.deepcopy(self.pods[name])
+        self._emit("DELETED", name, pod)
+
+    def close(self) -> None:
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def list_namespaced_pod(
+        self, namespace: str, label_selector: str = "", **kwargs: typing.Any
+    ) -> V1PodList:
+        with self.condition:
+            pods = [copy.deepcopy(pod) for pod in self.pods.values()]
+            version = str(self.version)
+        items = [pod for pod in pods if self._matches(pod, label_selector)]
+        return V1PodList(items=items, metadata=V1ListMeta(resource_version=version))
+
+    def watch(
+        self,
+        resource_version: str,
+        label_selector: str = "",
+        timeout_seconds: typing.Optional[float] = None,
+    ) -> typing.Iterator[dict]:
+        version = int(resource_version or 0)
+        deadline = time.monotonic() + (timeout_seconds or 3600)
+        while True:
+            with self.condition:
+                while not self.closed and self.version <= version:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return
+                    self.condition.wait(remaining)
+                if self.closed:
+                    raise ClusterClosed()
+                if self.events and self.events[0][0] > version + 1:
+                    yield {"type": "ERROR", "object": None, "raw_object": {"code": 410}}
+                    return
+                pending = [event for v, event in self.events if v > version]
+                version = self.version
+            for event in pending:
+                if self._matches(event["object"], label_selector):
+                    yield event
+
+    def _emit(self, event_type: str, name: str, pod: V1Pod) -> None:
+        with self.condition:
+            self.version += 1
+            pod.metadata.resource_version = str(self.version)
+            if event_type == "DELETED":
+                self.pods.pop(name, None)
+            else:
+                self.pods[name] = pod
+            event = {"type": event_type, "object": copy.deepcopy(pod)}
+            self.events.append((self.version, event))
+            if self.history and len(self.events) > self.history:
+                del self.events[: len(self.events) - self.history]
+            self.condition.notify_all()
+
+    @staticmethod
+    def _container(ready: bool) -> V1ContainerStatus:
+        return V1ContainerStatus(
+            name="postgres",
+            image="citusdata/citus",
+            image_id="",
+            ready=ready,
+            restart_count=0,
+        )
+
+    @staticmethod
+    def _matches(pod: V1Pod, label_selector: str) -> bool:
+        match = SELECTOR.match(label_selector)
+        if not match:
+            return True
+        values = {value.strip() for value in match.group(2).split(",")}
+        return (pod.metadata.labels or {}).get(match.group(1)) in values
+
+
+class FakeWatch:
+    def __init__(self, cluster: FakeCluster) -> None:
+        self.cluster = cluster
+
+    def __call__(self) -> "FakeWatch":
+        return self
+
+    def stream(
+        self,
+        func: typing.Callable,
+        namespace: str,
+        resource_version: str = "",
+        label_selector: str = "",
+        timeout_seconds: typing.Optional[float] = None,
+        **kwargs: typing.Any
+    ) -> typing.Iterator[dict]:
+        return self.cluster.watch(resource_version, label_selector, timeout_seconds)
+
+    def stop(self) -> None:
+        pass
+
+
+class FakePostgres:
+    def __init__(
+        self, connect_latency: float = 0.0, query_latency: float = 0.0
+    ) -> None:
+        self.connect_latency = connect_latency
+        self.query_latency = query_latency
+        self.lock = Lock()
+        self.connects: typing.Counter[str] = Counter()
+        self.round_trips: typing.Counter[str] = Counter()
+        self.statements: typing.Dict[str, typing.List[str]] = {}
+        self.nodes: typing.Dict[str, typing.Set[tuple]] = {}
+
+    def connect(self, host: str = "", **params: typing.Any) -> "FakeConnection":
+        time.sleep(self.connect_latency)
+        with self.lock:
+            self.connects[host] += 1
+            self.nodes.setdefault(host, set())
+        return FakeConnection(self, host)
+
+    def execute(self, host: str, query: str) -> list:
+        time.sleep(self.query_latency)
+        with self.lock:
+            self.round_trips[host] += 1
+            self.statements.setdefault(host, []).append(query)
+            nodes = self.nodes.setdefault(host, set())
+            for statement in query.split(";"):
+                node = NODE.search(statement)
+                if "master_add_node" in statement and node:
+                    nodes.add((node.group(1), int(node.group(2))))
+                elif "master_remove_node" in statement and node:
+                    nodes.discard((node.group(1), int(node.group(2))))
+                elif "FROM pg_dist_node" in statement:
+                    return sorted(nodes)
+        return []
+
+    def round_trip(self, host: str) -> None:
+        time.sleep(self.query_latency)
+        with self.lock:
+            self.round_trips[host] += 1
+
+    def registered(self, host: str) -> typing.Set[str]:
+        with self.lock:
+            return {node for node, _ in self.nodes.get(host, ())}
+
+    def totals(self) -> typing.Dict[str, int]:
+        with self.lock:
+            return {
+                "connects": sum(self.connects.values()),
+                "round_trips": sum(self.round_trips.values()),
+                "statements": sum(len(s) for s in self.statements.values()),
+            }
+
+
+class FakeConnection:
+    def __init__(self, server: FakePostgres, host: str) -> None:
+        self.server = server
+        self.host = host
+        self.closed = 0
+
+    def cursor(self) -> "FakeCursor":
+        return FakeCursor(self)
+
+    def commit(self) -> None:
+        self.server.round_trip(self.host)
+
+    def rollback(self) -> None:
+        self.server.round_trip(self.host)
+
+    def close(self) -> None:
+        self.closed = 1
+
+
+class FakeCursor:
+    def __init__(self, connection: FakeConnection) -> None:
+        self.connection = connection
+        self.rows: list = []
+
+    def __enter__(self) -> "FakeCursor":
+        return self
+
+    def __exit__(self, *args: typing.Any) -> None:
+        pass
+
+    def mogrify(self, query: str, params: typing.Optional[dict] = None) -> bytes:
+        if params:
+            query = query % {
+                key: "'{}'".format(value) if isinstance(value, str) else value
+                for key, value in params.items()
+            }
+        return query.encode()
+
+    def execute(self, query: str, params: typing.Optional[dict] = None) -> None:
+        connection = self.connection
+        statement = self.mogrify(query, params).decode()
+        self.rows = connection.server.execute(connection.host, statement)
+
+    def fetchall(self) -> list:
+        return self.rows
+
+
+class FakeLeaseStore(LeaseStore):
+    def __init__(self) -> None:
+        self.record: typing.Optional[LeaseRecord] = None
+        self.version = 0
+        self.available = True
+        self.lock = Lock()
+
+    def get(self) -> typing.Optional[LeaseRecord]:
+        with self.lock:
+            self._check()
+            return replace(self.record) if self.record else None
+
+    def create(self, record: LeaseRecord) -> bool:
+        with self.lock:
+            self._check()
+            if self.record is not None:
+                return False
+            self._store(record)
+            return True
+
+    def update(self, record: LeaseRecord) -> bool:
+        with self.lock:
+            self._check()
+            if self.record is None or self.record.version != record.version:
+                return False
+            self._store(record)
+            return True
+
+    def _store(self, record: LeaseRecord) -> None:
+        self.version += 1
+        self.record = replace(record, version=str(self.version))
+
+    def _check(self) -> None:
+        if not self.available:
+            raise ConnectionError("Lease store not available")
@@ -0,0 +1,7 @@
+import random
+
+
+def jittered_backoff(attempt: int, initial: float, maximum: float) -> float:
+    """Doubles the delay per attempt up to maximum, jittered over its upper half."""
+    delay = min(maximum, initial * 2 ** min(attempt, 32))
+    return random.uniform(delay / 2, delay)
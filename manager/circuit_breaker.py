@@ -0,0 +1,120 @@
+import typing
+import logging
+import time
+
+from dataclasses import dataclass
+from threading import Lock
+from backoff import jittered_backoff
+
+log = logging.getLogger(__file__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+@dataclass
+class Circuit:
+    state: str = CLOSED
+    failures: int = 0
+    trips: int = 0
+    open_until: float = 0.0
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        failure_threshold: int = 3,
+        reset_timeout: float = 5.0,
+        maximum_reset_timeout: float = 60.0,
+    ) -> None:
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.maximum_reset_timeout = maximum_reset_timeout
+        self.circuits: typing.Dict[str, Circuit] = {}
+        self.lock = Lock()
+
+    def allow(self, host: str) -> bool:
+        with self.lock:
+            circuit = self.circuits.get(host)
+            if circuit is None or circuit.state == CLOSED:
+                return True
+            if circuit.state == OPEN and time.monotonic() >= circuit.open_until:
+                # Let a single trial through, everyone else keeps failing fast
+                circuit.state = HALF_OPEN
+                log.info("Probing %s after its circuit was open", host)
+                return True
+            return False
+
+    def succeeded(self, host: str) -> None:
+        with self.lock:
+            circuit = self.circuits.pop(host, None)
+        if circuit is not None and circuit.state != CLOSED:
+            log.info("Closing circuit of %s", host)
+
+    def forget(self, host: str) -> None:
+        with self.lock:
+            self.circuits.pop(host, None)
+
+    def failed(self, host: str) -> None:
+        with self.lock:
+            circuit = self.circuits.setdefault(host, Circuit())
+            circuit.failures += 1
+            if circuit.state == CLOSED and circuit.failures < self.failure_threshold:
+                return
+            delay = jittered_backoff(
+                circuit.trips, self.reset_timeout, self.maximum_reset_timeout
+            )
+            circuit.state = OPEN
+            circuit.trips += 1
+            circuit.open_until = time.monotonic() + delay
+        log.error("Opening circuit of %s for %.1fs", host, delay)
+
+    def check(self, host: str) -> None:
+        if not self.allow(host):
+            raise CircuitOpenError("Circuit of {} is open".format(host))
+
+    def state(self, host: str) -> str:
+        with self.lock:
+            circuit = self.circuits.get(host)
+            return circuit.state if circuit is not None else CLOSED
+
+    def snapshot(self) -> typing.Dict[str, dict]:
+        now = time.monotonic()
+        with self.lock:
+            return {
+                host: {
+                    "state": circuit.state,
+                    "failures": circuit.failures,
+                    "retry_in": round(max(0.0, circuit.open_until - now), 3),
+                }
+                for host, circuit in self.circuits.items()
+            }
+
+
+class RetryBudget:
+    """Token bucket shared by all hosts, every retry spends one token."""
+
+    def __init__(self, capacity: float, refill_per_second: float) -> None:
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = Lock()
+
+    def acquire(self) -> bool:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity,
+                self.tokens + (now - self.updated) * self.refill_per_second,
+            )
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
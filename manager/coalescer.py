@@ -0,0 +1,52 @@
+import typing
+import logging
+import time
+
+from threading import Lock, Timer
+
+log = logging.getLogger(__file__)
+
+# Receives the latest update and the time it was submitted per key
+Flush = typing.Callable[[typing.Dict[str, str], typing.Dict[str, float]], None]
+
+
+class Coalescer:
+    def __init__(self, window: float, flush: Flush) -> None:
+        self.window = window
+        self.flush_updates = flush
+        self.pending: typing.Dict[str, str] = {}
+        self.submitted: typing.Dict[str, float] = {}
+        self.lock = Lock()
+        self.flush_lock = Lock()
+        self.timer: typing.Optional[Timer] = None
+
+    def submit(
+        self, key: str, update: str, submitted: typing.Optional[float] = None
+    ) -> None:
+        with self.lock:
+            self.pending.pop(key, None)
+            self.pending[key] = update
+            self.submitted[key] = time.monotonic() if submitted is None else submitted
+            if self.window > 0 and self.timer is None:
+                self.timer = Timer(self.window, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+        if self.window <= 0:
+            self.flush()
+
+    def idle(self) -> bool:
+        return not self.flush_lock.locked() and not self.pending
+
+    def flush(self) -> None:
+        with self.flush_lock:
+            with self.lock:
+                updates, self.pending = self.pending, {}
+                submitted, self.submitted = self.submitted, {}
+                self.timer = None
+            if not updates:
+                return
+            log.info("Applying %s coalesced updates", len(updates))
+            try:
+                self.flush_updates(updates, submitted)
+            except Exception as e:
+                log.error("Error while applying updates %s: %s", updates, e)
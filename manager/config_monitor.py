@@ -1,21 +1,197 @@
 import typing
 import logging
+import functools
 import hashlib
+import json
 import time
+import os
+import jinja2
 
 
-from threading import Thread
-from dataclasses import dataclass
-from db import DBHandler
+from threading import Thread, Lock
+from dataclasses import dataclass, field, asdict
+from db import DBHandler, StatementError
+from sql_script import split_statements
+from parallel import ParallelExecutor
+from metrics import PROVISION_NODE, PROVISION_FILE
+from pod_state import NodeSet
+from templates import compile_template, pod_context, pod_ordinal
+from kubernetes.client import V1Pod
+from kubernetes.client.rest import ApiException
+from inotify import Inotify, DIRECTORY_CHANGES, IN_Q_OVERFLOW, IN_IGNORED
 
 log = logging.getLogger(__file__)
 
+Job = typing.Callable[[], None]
+
 
 @dataclass
 class PodMonitorConfig:
-    pod_names: typing.Set[str]
+    pod_names: NodeSet
     monitor_file: str
     service_name: str
+    batch: bool = False
+
+
+class ProvisionError(Exception):
+    pass
+
+
+@dataclass
+class ProvisionSummary:
+    succeeded: typing.List[str] = field(default_factory=list)
+    failed: typing.List[str] = field(default_factory=list)
+
+
+class ProvisionProgress:
+    def __init__(self, name: str, pod_names: typing.List[str]) -> None:
+        self.name = name
+        self.states = {pod: "pending" for pod in pod_names}
+        self.lock = Lock()
+
+    def update(self, pod_name: str, state: str) -> None:
+        with self.lock:
+            self.states[pod_name] = state
+            done = sum(s in ("succeeded", "failed") for s in self.states.values())
+        log.info(
+            "Provisioning %s on %s %s (%s/%s done)",
+            self.name,
+            pod_name,
+            state,
+            done,
+            len(self.states),
+        )
+
+    def snapshot(self) -> typing.Dict[str, str]:
+        with self.lock:
+            return dict(self.states)
+
+
+@dataclass
+class LedgerEntry:
+    script_hash: str
+    timestamp: float
+    outcome: str
+
+
+class ProvisionLedger:
+    def __init__(self) -> None:
+        self.entries: typing.Dict[str, LedgerEntry] = {}
+        self.lock = Lock()
+
+    def record(self, pod_name: str, script_hash: str, outcome: str) -> None:
+        with self.lock:
+            self.entries[pod_name] = LedgerEntry(script_hash, time.time(), outcome)
+
+    def is_current(self, pod_name: str, script_hash: str) -> bool:
+        with self.lock:
+            entry = self.entries.get(pod_name)
+        return (
+            entry is not None
+            and entry.script_hash == script_hash
+            and entry.outcome == "succeeded"
+        )
+
+    def outdated(
+        self, pod_names: typing.List[str], script_hash: str
+    ) -> typing.List[str]:
+        return [pod for pod in pod_names if not self.is_current(pod, script_hash)]
+
+    def forget(self, pod_name: str) -> None:
+        with self.lock:
+            self.entries.pop(pod_name, None)
+
+    def snapshot(self) -> typing.Dict[str, dict]:
+        with self.lock:
+            return {pod: asdict(entry) for pod, entry in self.entries.items()}
+
+    def restore(self, entries: typing.Dict[str, dict]) -> None:
+        with self.lock:
+            self.entries = {pod: LedgerEntry(**entry) for pod, entry in entries.items()}
+
+
+@dataclass(frozen=True)
+class Script:
+    statements: typing.List[str]
+    script_hash: str
+
+
+class ScriptCache:
+    def __init__(
+        self, read: typing.Callable[[str], str], templates: bool = False
+    ) -> None:
+        self.read = read
+        self.templates = templates
+        self.scripts: typing.Dict[str, Script] = {}
+        self.compiled: typing.Dict[str, jinja2.Template] = {}
+        # Last rendering per file and node, keyed by the context it was rendered with
+        self.rendered: typing.Dict[
+            typing.Tuple[str, str], typing.Tuple[str, Script]
+        ] = {}
+        self.lock = Lock()
+
+    def get(self, path: str) -> Script:
+        with self.lock:
+            script = self.scripts.get(path)
+            if script is None:
+                script = self.scripts[path] = self.parse(self.read(path))
+                log.info("Parsed %s statements from %s", len(script.statements), path)
+            return script
+
+    def prime(self, path: str) -> None:
+        if self.templates:
+            self.compile(path)
+        else:
+            self.get(path)
+
+    def compile(self, path: str) -> jinja2.Template:
+        with self.lock:
+            template = self.compiled.get(path)
+            if template is None:
+                template = self.compiled[path] = compile_template(self.read(path))
+                log.info("Compiled template %s", path)
+            return template
+
+    def render(
+        self, path: str, pod_name: str, context: typing.Dict[str, typing.Any]
+    ) -> Script:
+        if not self.templates:
+            return self.get(path)
+        key = json.dumps(context, sort_keys=True, default=str)
+        template = self.compile(path)
+        with self.lock:
+            cached = self.rendered.get((path, pod_name))
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        script = self.parse(template.render(context))
+        with self.lock:
+            if path in self.compiled:
+                self.rendered[(path, pod_name)] = (key, script)
+        return script
+
+    @staticmethod
+    def parse(source: str) -> Script:
+        statements = split_statements(source)
+        hasher = hashlib.md5("\0".join(statements).encode())
+        return Script(statements, hasher.hexdigest())
+
+    def forget(self, pod_name: str) -> None:
+        with self.lock:
+            for key in [key for key in self.rendered if key[1] == pod_name]:
+                del self.rendered[key]
+
+    def invalidate(self, path: str) -> None:
+        with self.lock:
+            self.scripts.pop(path, None)
+            self.compiled.pop(path, None)
+            for key in [key for key in self.rendered if key[0] == path]:
+                del self.rendered[key]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.scripts.clear()
+            self.compiled.clear()
+            self.rendered.clear()
 
 
 class ConfigMonitor:
@@ -24,77 +200,300 @@ class ConfigMonitor:
         db_handler: DBHandler,
         master_config: PodMonitorConfig,
         worker_config: PodMonitorConfig,
+        parallelism: int = 1,
+        timeout: float = 600,
+        watch_interval: float = 5.0,
+        schedule: typing.Optional[typing.Callable[[Job], None]] = None,
+        templates: bool = False,
+        get_pod: typing.Callable[[str], typing.Optional[V1Pod]] = lambda name: None,
     ) -> None:
         self.master_provision_path = master_config.monitor_file
         self.worker_provision_path = worker_config.monitor_file
         self.master_service = master_config.service_name
         self.worker_service = worker_config.service_name
+        self.master_batch = master_config.batch
+        self.worker_batch = worker_config.batch
         self.db_handler = db_handler
+        self.watch_interval = watch_interval
+        self.schedule = schedule
+        self.get_pod = get_pod
 
         self.workers = worker_config.pod_names
         self.masters = master_config.pod_names
+        self.executor = ParallelExecutor(parallelism, timeout, "provisioning")
+        self.progress: typing.Dict[str, ProvisionProgress] = {}
+        self.ledger = ProvisionLedger()
+        self.scripts = ScriptCache(self.read_config, templates)
 
     @staticmethod
-    def load_config_map(config_path: str) -> typing.List[str]:
-        def read_config(path: str) -> typing.List["str"]:
-            with open(path, "r") as f:
-                return f.readlines()
+    def read_config(config_path: str) -> str:
+        with open(config_path, "r") as f:
+            return f.read()
+
+    def node_context(
+        self, pod_name: str, service_name: str
+    ) -> typing.Dict[str, typing.Any]:
+        context = pod_context(self.get_pod(pod_name))
+        context.update(
+            pod_name=pod_name,
+            ordinal=pod_ordinal(pod_name),
+            host=self.db_handler.get_host_name(pod_name, service_name),
+            service=service_name,
+            masters=self.masters.snapshot(),
+            workers=self.workers.snapshot(),
+        )
+        return context
 
-        return read_config(config_path)
+    def script_for(self, config_path: str, pod_name: str, service_name: str) -> Script:
+        if not self.scripts.templates:
+            return self.scripts.get(config_path)
+        try:
+            return self.scripts.render(
+                config_path, pod_name, self.node_context(pod_name, service_name)
+            )
+        except (jinja2.TemplateError, ApiException) as e:
+            raise ProvisionError(
+                "Could not render {} for {}: {}".format(
+                    os.path.basename(config_path), pod_name, e
+                )
+            )
 
-    def update_masters(self):
+    def update_masters(self) -> ProvisionSummary:
         log.info("Update masters with new config")
-        for pod in self.masters:
-            self.provision_master(pod)
+        return self.provision_nodes(
+            self.masters.snapshot(),
+            self.master_provision_path,
+            self.master_service,
+            self.master_batch,
+        )
 
-    def update_workers(self):
+    def update_workers(self) -> ProvisionSummary:
         log.info("Update workers with new config")
-        for pod in self.workers:
-            self.provision_worker(pod)
+        return self.provision_nodes(
+            self.workers.snapshot(),
+            self.worker_provision_path,
+            self.worker_service,
+            self.worker_batch,
+        )
+
+    def provision_nodes(
+        self,
+        pod_names: typing.List[str],
+        config_path: str,
+        service_name: str,
+        batch: bool,
+    ) -> ProvisionSummary:
+        with PROVISION_FILE.time(file=os.path.basename(config_path)):
+            return self._provision_nodes(pod_names, config_path, service_name, batch)
+
+    def _provision_nodes(
+        self,
+        pod_names: typing.List[str],
+        config_path: str,
+        service_name: str,
+        batch: bool,
+    ) -> ProvisionSummary:
+        scripts: typing.Dict[str, Script] = {}
+        summary = ProvisionSummary()
+        for pod_name in pod_names:
+            try:
+                scripts[pod_name] = self.script_for(config_path, pod_name, service_name)
+            except ProvisionError as e:
+                log.error(e)
+                self.ledger.record(pod_name, "", "failed")
+                summary.failed.append(pod_name)
+        outdated = [
+            pod_name
+            for pod_name, script in scripts.items()
+            if not self.ledger.is_current(pod_name, script.script_hash)
+        ]
+        if len(outdated) < len(scripts):
+            log.info(
+                "Skipping %s of %s nodes already provisioned with %s",
+                len(scripts) - len(outdated),
+                len(scripts),
+                os.path.basename(config_path),
+            )
+        pod_names = outdated
+        progress = ProvisionProgress(service_name, pod_names)
+        self.progress[service_name] = progress
+
+        def provision(pod_name: str) -> None:
+            script = scripts[pod_name]
+            progress.update(pod_name, "running")
+            errors = self.provision_node(script, pod_name, service_name, batch)
+            progress.update(pod_name, "failed" if errors else "succeeded")
+            if errors:
+                raise ProvisionError(
+                    "{} of {} queries failed".format(
+                        len(errors), len(script.statements)
+                    )
+                )
+
+        results = self.executor.run(provision, pod_names)
+        for pod_name, result in results.items():
+            if result.ok:
+                summary.succeeded.append(pod_name)
+            else:
+                if progress.snapshot()[pod_name] != "failed":
+                    progress.update(pod_name, "failed")
+                summary.failed.append(pod_name)
+        log.info(
+            "Provisioning %s finished, succeeded: %s, failed: %s",
+            service_name,
+            summary.succeeded,
+            summary.failed,
+        )
+        return summary
+
+    def provision_workers(self, pod_names: typing.List[str]) -> ProvisionSummary:
+        return self.provision_nodes(
+            pod_names,
+            self.worker_provision_path,
+            self.worker_service,
+            self.worker_batch,
+        )
 
     def provision_master(self, pod_name: str) -> None:
-        master_provision = self.load_config_map(self.master_provision_path)
-        self.provision_node(master_provision, pod_name, self.master_service)
+        self.provision_single(
+            self.master_provision_path, pod_name, self.master_service, self.master_batch
+        )
 
     def provision_worker(self, pod_name: str) -> None:
-        worker_provision = self.load_config_map(self.worker_provision_path)
-        self.provision_node(worker_provision, pod_name, self.worker_service)
+        self.provision_single(
+            self.worker_provision_path, pod_name, self.worker_service, self.worker_batch
+        )
+
+    def provision_single(
+        self, config_path: str, pod_name: str, service_name: str, batch: bool
+    ) -> typing.List[StatementError]:
+        try:
+            script = self.script_for(config_path, pod_name, service_name)
+        except ProvisionError as e:
+            log.error(e)
+            self.ledger.record(pod_name, "", "failed")
+            return [StatementError(-1, "", str(e))]
+        return self.provision_node(script, pod_name, service_name, batch)
+
+    def forget(self, pod_name: str) -> None:
+        self.ledger.forget(pod_name)
+        self.scripts.forget(pod_name)
 
     def provision_all_nodes(self) -> None:
         self.update_masters()
         self.update_workers()
 
     def provision_node(
-        self, queries: typing.List[str], pod_name: str, service_name: str
-    ) -> None:
-        for query in queries:
-            try:
-                log.info("Running provision query on: %s", pod_name)
-                self.db_handler.execute_query(pod_name, service_name, query)
-            except Exception as e:
-                log.error("Error %s while executing provision query: %s", e, query)
+        self, script: Script, pod_name: str, service_name: str, batch: bool = False
+    ) -> typing.List[StatementError]:
+        queries, script_hash = script.statements, script.script_hash
+        if self.ledger.is_current(pod_name, script_hash):
+            log.info("%s is already provisioned with %s", pod_name, script_hash)
+            return []
+        log.info("Running %s provision queries on: %s", len(queries), pod_name)
+        try:
+            with PROVISION_NODE.time(service=service_name):
+                errors = self.db_handler.execute_script(
+                    pod_name, service_name, queries, batch
+                )
+        except Exception as e:
+            log.error("Error %s while provisioning %s", e, pod_name)
+            self.ledger.record(pod_name, script_hash, "failed")
+            return [StatementError(-1, "", str(e))]
+        self.ledger.record(pod_name, script_hash, "failed" if errors else "succeeded")
+        for error in errors:
+            log.error(
+                "Error %s while executing provision query %s: %s",
+                error.error,
+                error.index,
+                error.statement,
+            )
+        return errors
+
+    def provision_progress(self) -> typing.Dict[str, typing.Dict[str, str]]:
+        return {name: p.snapshot() for name, p in self.progress.items()}
+
+    def prime_scripts(self) -> None:
+        self.scripts.prime(self.master_provision_path)
+        self.scripts.prime(self.worker_provision_path)
+
+    def reload(self, config_path: str, update: typing.Callable[[], object]) -> None:
+        self.scripts.invalidate(config_path)
+        update()
 
     def start_watchers(self):
-        FileWatcher(self.update_masters, self.master_provision_path).start()
-        FileWatcher(self.update_workers, self.worker_provision_path).start()
+        for config_path, update in (
+            (self.master_provision_path, self.update_masters),
+            (self.worker_provision_path, self.update_workers),
+        ):
+            updater: Job = functools.partial(self.reload, config_path, update)
+            if self.schedule is not None:
+                updater = functools.partial(self.schedule, updater)
+            FileWatcher(updater, config_path, self.watch_interval).start()
 
 
 class FileWatcher:
-    def __init__(self, updater: typing.Callable[[], None], file_path: str) -> None:
+    # Kubernetes updates config map volumes by swapping the ..data symlink
+    watched_names = ("..data",)
+    resync_interval = 60.0
+
+    def __init__(
+        self,
+        updater: typing.Callable[[], None],
+        file_path: str,
+        poll_interval: float = 5.0,
+    ) -> None:
         self.file_path = file_path
+        self.poll_interval = poll_interval
+        self.current_stat = self.get_file_stat(self.file_path)
         self.current_hash = self.get_file_hash(self.file_path)
         self.updater = updater
 
     def start(self) -> None:
         log.info("Start watcher for: %s", self.file_path)
+        try:
+            notifier = Inotify()
+            notifier.add_watch(
+                os.path.dirname(self.file_path) or ".", DIRECTORY_CHANGES
+            )
+        except OSError as e:
+            log.info(
+                "Inotify not available (%s), polling %s every %ss",
+                e,
+                self.file_path,
+                self.poll_interval,
+            )
+            Thread(target=self.poll).start()
+            return
+        Thread(target=self.watch, args=(notifier,)).start()
 
-        def run() -> None:
-            while True:
-                new_hash = self.get_file_hash(self.file_path)
-                self.compare_hashs_for_update(new_hash)
-                time.sleep(5)
+    def watch(self, notifier: Inotify) -> None:
+        names = self.watched_names + (os.path.basename(self.file_path),)
+        while True:
+            events = notifier.read_events(self.resync_interval)
+            if not events or any(
+                event.name in names or event.mask & (IN_Q_OVERFLOW | IN_IGNORED)
+                for event in events
+            ):
+                self.check_for_update()
 
-        Thread(target=run).start()
+    def poll(self) -> None:
+        while True:
+            time.sleep(self.poll_interval)
+            self.check_for_update()
+
+    def check_for_update(self) -> None:
+        try:
+            new_stat = self.get_file_stat(self.file_path)
+            if new_stat == self.current_stat:
+                log.debug("No changes for %s", self.file_path)
+                return
+            self.current_stat = new_stat
+            new_hash = self.get_file_hash(self.file_path)
+        except OSError as e:
+            log.info("Could not read %s: %s", self.file_path, e)
+            return
+        self.compare_hashs_for_update(new_hash)
 
     def compare_hashs_for_update(self, new_hash: bytes) -> None:
         if new_hash != self.current_hash:
@@ -104,6 +503,11 @@ class FileWatcher:
         else:
             log.debug("No changes for %s", self.file_path)
 
+    @staticmethod
+    def get_file_stat(path: str) -> typing.Tuple[int, int, int, int]:
+        stat = os.stat(path)
+        return stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns
+
     @staticmethod
     def get_file_hash(path: str) -> bytes:
         hasher = hashlib.md5()
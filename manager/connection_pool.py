@@ -0,0 +1,187 @@
+import typing
+import logging
+import time
+import psycopg2
+
+from collections import deque
+from dataclasses import dataclass, field
+from threading import Condition
+
+log = logging.getLogger(__file__)
+
+
+class PoolExhaustedError(Exception):
+    pass
+
+
+@dataclass
+class IdleConnection:
+    connection: psycopg2._psycopg.connection
+    generation: int
+    last_used: float
+
+
+@dataclass
+class HostStats:
+    in_use: int = 0
+    created: int = 0
+    reused: int = 0
+    evicted: int = 0
+
+
+@dataclass
+class HostPool:
+    idle: typing.Deque[IdleConnection] = field(default_factory=deque)
+    stats: HostStats = field(default_factory=HostStats)
+    generation: int = 0
+    leases: typing.Dict[int, int] = field(default_factory=dict)
+
+
+Connector = typing.Callable[[str], psycopg2._psycopg.connection]
+
+
+class ConnectionPool:
+    def __init__(
+        self,
+        connector: Connector,
+        max_size: int,
+        max_idle: float,
+        health_check_after: float = 30.0,
+        acquire_timeout: float = 60.0,
+    ) -> None:
+        self.connector = connector
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.health_check_after = health_check_after
+        self.acquire_timeout = acquire_timeout
+        self.hosts: typing.Dict[str, HostPool] = {}
+        self.condition = Condition()
+
+    def acquire(
+        self, host: str, connector: typing.Optional[Connector] = None
+    ) -> psycopg2._psycopg.connection:
+        deadline = time.monotonic() + self.acquire_timeout
+        while True:
+            candidate = self._reserve(host, deadline)
+            if candidate is None:
+                return self._open(host, connector or self.connector)
+            if self._is_healthy(candidate):
+                with self.condition:
+                    self.hosts[host].stats.reused += 1
+                return candidate.connection
+            self.release(host, candidate.connection, discard=True)
+
+    def release(
+        self, host: str, connection: psycopg2._psycopg.connection, discard: bool = False
+    ) -> None:
+        with self.condition:
+            pool = self.hosts.setdefault(host, HostPool())
+            generation = pool.leases.pop(id(connection), pool.generation)
+            pool.stats.in_use -= 1
+            stale = generation != pool.generation
+            if discard or stale or connection.closed:
+                self._close(host, connection, pool)
+            else:
+                pool.idle.append(
+                    IdleConnection(connection, generation, time.monotonic())
+                )
+            self.condition.notify_all()
+
+    def evict(self, host: str) -> None:
+        with self.condition:
+            pool = self.hosts.get(host)
+            if pool is None:
+                return
+            log.info("Evicting pooled connections to %s", host)
+            pool.generation += 1
+            while pool.idle:
+                self._close(host, pool.idle.pop().connection, pool)
+            if not pool.stats.in_use:
+                del self.hosts[host]
+
+    def close_all(self) -> None:
+        for host in list(self.hosts):
+            self.evict(host)
+
+    def stats(self) -> typing.Dict[str, dict]:
+        with self.condition:
+            return {
+                host: {
+                    "idle": len(pool.idle),
+                    "in_use": pool.stats.in_use,
+                    "created": pool.stats.created,
+                    "reused": pool.stats.reused,
+                    "evicted": pool.stats.evicted,
+                }
+                for host, pool in self.hosts.items()
+            }
+
+    def _reserve(self, host: str, deadline: float) -> typing.Optional[IdleConnection]:
+        with self.condition:
+            self._prune_idle()
+            pool = self.hosts.setdefault(host, HostPool())
+            while True:
+                if pool.idle:
+                    candidate = pool.idle.pop()
+                    pool.stats.in_use += 1
+                    pool.leases[id(candidate.connection)] = candidate.generation
+                    return candidate
+                if pool.stats.in_use < self.max_size:
+                    pool.stats.in_use += 1
+                    return None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolExhaustedError(
+                        "No free connection to {} within {}s".format(
+                            host, self.acquire_timeout
+                        )
+                    )
+                self.condition.wait(remaining)
+
+    def _open(self, host: str, connector: Connector) -> psycopg2._psycopg.connection:
+        with self.condition:
+            generation = self.hosts[host].generation
+        try:
+            connection = connector(host)
+        except Exception:
+            with self.condition:
+                pool = self.hosts.setdefault(host, HostPool())
+                pool.stats.in_use -= 1
+                self.condition.notify_all()
+            raise
+        with self.condition:
+            pool = self.hosts.setdefault(host, HostPool())
+            pool.stats.created += 1
+            pool.leases[id(connection)] = generation
+        return connection
+
+    def _prune_idle(self) -> None:
+        now = time.monotonic()
+        for host, pool in self.hosts.items():
+            while pool.idle and now - pool.idle[0].last_used > self.max_idle:
+                log.debug("Closing idle connection to %s", host)
+                self._close(host, pool.idle.popleft().connection, pool)
+
+    def _is_healthy(self, candidate: IdleConnection) -> bool:
+        if candidate.connection.closed:
+            return False
+        if time.monotonic() - candidate.last_used < self.health_check_after:
+            return True
+        try:
+            with candidate.connection.cursor() as cur:
+                cur.execute("SELECT 1")
+            candidate.connection.rollback()
+            return True
+        except psycopg2.Error as e:
+            log.info("Discarding broken pooled connection: %s", e)
+            return False
+
+    @staticmethod
+    def _close(
+        host: str, connection: psycopg2._psycopg.connection, pool: HostPool
+    ) -> None:
+        pool.stats.evicted += 1
+        try:
+            connection.close()
+        except psycopg2.Error as e:
+            log.debug("Error while closing connection to %s: %s", host, e)
@@ -1,19 +1,60 @@
 import typing
 import psycopg2
-import retrying
 import logging
+import time
 
 from env_conf import EnvConf
+from backoff import jittered_backoff
 from contextlib import contextmanager
+from dataclasses import dataclass
+from connection_pool import ConnectionPool
+from circuit_breaker import CircuitBreaker, RetryBudget, CLOSED
+from metrics import DB_CONNECT, DB_QUERY, RETRIES
 
 log = logging.getLogger(__file__)
 
+BATCH_SEPARATOR = "\n;\n"
+
+
+@dataclass
+class StatementError:
+    index: int
+    statement: str
+    error: str
+
+
+def locate_statement(
+    statements: typing.List[str], position: typing.Optional[str]
+) -> int:
+    """Index of the statement at a 1-based position in the joined batch, or -1."""
+    if not position:
+        return -1
+    offset = int(position) - 1
+    start = 0
+    for index, statement in enumerate(statements):
+        if start <= offset < start + len(statement):
+            return index
+        start += len(statement) + len(BATCH_SEPARATOR)
+    return -1
+
 
 class DBHandler:
+    connect_attempts = 10
+    initial_backoff = 0.5
+    maximum_backoff = 5.0
+
     def __init__(self, conf: EnvConf) -> None:
         self.pg_params = self.get_pg_connection_parameters(conf)
         self.namespace = conf.namespace
         self.short_url = conf.short_url
+        self.pool = ConnectionPool(
+            self._create_connection, conf.pool_max_size, conf.pool_max_idle
+        )
+        self.breaker = CircuitBreaker(
+            conf.circuit_failures, conf.circuit_reset, conf.circuit_max_reset
+        )
+        # The budget refills completely within ten seconds
+        self.retry_budget = RetryBudget(conf.retry_budget, conf.retry_budget / 10)
 
     @staticmethod
     def get_pg_connection_parameters(conf: EnvConf) -> dict:
@@ -30,25 +71,76 @@ class DBHandler:
             parameters.pop(option)
         return parameters
 
+    def _create_connection(self, host: str) -> psycopg2._psycopg.connection:
+        attempt = 0
+        while True:
+            self.breaker.check(host)
+            try:
+                connection = self._connect(host)
+            except Exception as e:
+                self.breaker.failed(host)
+                attempt += 1
+                # Fail fast once the circuit opened or other hosts used up the retries
+                if (
+                    attempt >= self.connect_attempts
+                    or self.breaker.state(host) != CLOSED
+                    or not self.retry_budget.acquire()
+                ):
+                    raise
+                delay = jittered_backoff(
+                    attempt, self.initial_backoff, self.maximum_backoff
+                )
+                log.info("Connecting to %s failed (%s), retry in %.2fs", host, e, delay)
+                RETRIES.inc(operation="db_connect")
+                time.sleep(delay)
+            else:
+                self.breaker.succeeded(host)
+                return connection
+
+    def _connect(self, host: str) -> psycopg2._psycopg.connection:
+        # Probes connect here directly, a booting pod must not open its circuit
+        with DB_CONNECT.time(host=host):
+            connection = psycopg2.connect(**self.pg_params, host=host)
+        log.info("Connected to pg db on: %s", host)
+        return connection
+
     @contextmanager
     def _connect_to_db(
-        self, host: str
+        self, host: str, retry: bool = True
     ) -> typing.Iterator[psycopg2._psycopg.connection]:
-        @retrying.retry(wait_fixed=5 * 1000, stop_max_attempt_number=10)
-        def connector() -> psycopg2._psycopg.connection:
-            conn = psycopg2.connect(**self.pg_params, host=host)
-            return conn
-
+        connection = None
+        broken = False
         try:
-            connection = connector()
-            log.info("Connected to pg db on: %s", host)
+            connection = self.pool.acquire(host, None if retry else self._connect)
             yield connection
+            connection.commit()
         except Exception as e:
             log.info(e)
-            log.info("Error while connecting to %s", host)
+            log.info("Error while executing on %s", host)
+            broken = connection is None or not self._rollback(connection)
+            raise
         finally:
-            connection.commit()
-            connection.close()
+            if connection is not None:
+                self.pool.release(host, connection, discard=broken)
+
+    @staticmethod
+    def _rollback(connection: psycopg2._psycopg.connection) -> bool:
+        try:
+            connection.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def evict_host(self, pod_name: str, service_name: str) -> None:
+        host = self.get_host_name(pod_name, service_name)
+        self.pool.evict(host)
+        self.breaker.forget(host)
+
+    def pool_stats(self) -> typing.Dict[str, dict]:
+        return self.pool.stats()
+
+    def circuit_stats(self) -> typing.Dict[str, dict]:
+        return self.breaker.snapshot()
 
     def get_host_name(self, pod_name: str, service_name: str) -> str:
         if self.short_url:
@@ -65,7 +157,100 @@ class DBHandler:
         if not query_params:
             query_params = {}
         host = self.get_host_name(pod_name, service_name)
-        with self._connect_to_db(host) as conn:
+        with self._connect_to_db(host) as conn, DB_QUERY.time(host=host):
             with conn.cursor() as cur:
                 log.info("Executing query %s with %s", query, query_params)
                 cur.execute(query, query_params)
+
+    def execute_batch(
+        self,
+        pod_name: str,
+        service_name: str,
+        queries: typing.List[typing.Tuple[str, dict]],
+    ) -> None:
+        host = self.get_host_name(pod_name, service_name)
+        with self._connect_to_db(host) as conn, DB_QUERY.time(host=host):
+            with conn.cursor() as cur:
+                batch = ";\n".join(
+                    cur.mogrify(query, params).decode() for query, params in queries
+                )
+                log.info("Executing batch of %s queries on %s", len(queries), host)
+                cur.execute(batch)
+
+    def fetch_query(
+        self, pod_name: str, service_name: str, query: str, query_params: dict = None
+    ) -> typing.List[tuple]:
+        if not query_params:
+            query_params = {}
+        host = self.get_host_name(pod_name, service_name)
+        with self._connect_to_db(host) as conn, DB_QUERY.time(host=host):
+            with conn.cursor() as cur:
+                log.debug("Fetching query %s with %s", query, query_params)
+                cur.execute(query, query_params)
+                return cur.fetchall()
+
+    def probe(self, pod_name: str, service_name: str) -> bool:
+        host = self.get_host_name(pod_name, service_name)
+        try:
+            with self._connect_to_db(host, retry=False) as conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+            return True
+        except Exception as e:
+            log.debug("Probe of %s failed: %s", host, e)
+            return False
+
+    def is_service_host(self, host: str, service_name: str) -> bool:
+        return host.endswith(self.get_host_name("", service_name))
+
+    def execute_script(
+        self,
+        pod_name: str,
+        service_name: str,
+        statements: typing.List[str],
+        batch: bool = False,
+    ) -> typing.List[StatementError]:
+        host = self.get_host_name(pod_name, service_name)
+        with self._connect_to_db(host) as conn, DB_QUERY.time(host=host):
+            if batch:
+                return self._execute_batch(conn, statements)
+            return self._execute_each(conn, statements)
+
+    @staticmethod
+    def _execute_each(
+        conn: psycopg2._psycopg.connection, statements: typing.List[str]
+    ) -> typing.List[StatementError]:
+        errors = []
+        for index, statement in enumerate(statements):
+            try:
+                with conn.cursor() as cur:
+                    log.info("Executing query %s", statement)
+                    cur.execute(statement)
+                conn.commit()
+            except psycopg2.Error as e:
+                if conn.closed:
+                    raise
+                conn.rollback()
+                errors.append(StatementError(index, statement, str(e).strip()))
+        return errors
+
+    @staticmethod
+    def _execute_batch(
+        conn: psycopg2._psycopg.connection, statements: typing.List[str]
+    ) -> typing.List[StatementError]:
+        try:
+            with conn.cursor() as cur:
+                log.info("Executing batch of %s statements", len(statements))
+                # Statements may end in a -- comment, keep the ; out of it
+                cur.execute(BATCH_SEPARATOR.join(statements))
+            conn.commit()
+            return []
+        except psycopg2.Error as e:
+            if conn.closed:
+                raise
+            conn.rollback()
+            # Replaying the batch to find the culprit would repeat side effects
+            # outside of the transaction, e.g. of run_command_on_workers
+            index = locate_statement(statements, e.diag.statement_position)
+            statement = statements[index] if index >= 0 else ""
+            return [StatementError(index, statement, str(e).strip())]
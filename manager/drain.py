@@ -0,0 +1,217 @@
+import typing
+import logging
+import time
+
+from collections import defaultdict
+from dataclasses import dataclass
+from threading import Lock
+from db import DBHandler
+from parallel import ParallelExecutor, TaskTimeoutError
+
+log = logging.getLogger(__file__)
+
+PLACEMENTS_QUERY = """SELECT placement.shardid, placement.nodename
+    FROM pg_dist_shard_placement placement
+    JOIN pg_dist_shard shard ON shard.shardid = placement.shardid
+    JOIN pg_dist_partition partition ON partition.logicalrelid = shard.logicalrelid
+    WHERE placement.nodeport = %(port)s AND partition.partmethod <> 'n'"""
+MOVE_SHARD_QUERY = """SELECT master_move_shard_placement(
+    %(shard)s, %(source)s, %(port)s, %(target)s, %(port)s)"""
+
+
+@dataclass(frozen=True)
+class ShardMove:
+    shard: int
+    source: str
+    target: str
+
+
+class MoveProgress:
+    def __init__(self, name: str, total: int) -> None:
+        self.name = name
+        self.total = total
+        self.moved = 0
+        self.failed = 0
+        self.started = time.monotonic()
+        self.finished: typing.Optional[float] = None
+        self.lock = Lock()
+
+    def update(self, moved: bool) -> None:
+        with self.lock:
+            if moved:
+                self.moved += 1
+            else:
+                self.failed += 1
+            done = self.moved + self.failed
+        log.info("Moving shards for %s (%s/%s done)", self.name, done, self.total)
+
+    def finish(self) -> None:
+        with self.lock:
+            self.finished = time.monotonic()
+
+    def snapshot(self) -> typing.Dict[str, float]:
+        with self.lock:
+            end = self.finished or time.monotonic()
+            return {
+                "total": self.total,
+                "moved": self.moved,
+                "failed": self.failed,
+                "seconds": round(end - self.started, 3),
+            }
+
+
+class ShardMover:
+    # Number of finished drains and rebalances kept for /shard-moves
+    history = 10
+
+    def __init__(
+        self,
+        db_handler: DBHandler,
+        master_service: str,
+        port: int,
+        parallelism: int,
+        timeout: float,
+    ) -> None:
+        self.db_handler = db_handler
+        self.master_service = master_service
+        self.port = port
+        self.timeout = timeout
+        self.executor = ParallelExecutor(parallelism, timeout, "shard-moves")
+        self.progress: typing.Dict[str, MoveProgress] = {}
+
+    def drain(
+        self, master: str, source: str, targets: typing.List[str]
+    ) -> MoveProgress:
+        moves = self.plan_drain(self.placements(master), source, targets)
+        return self.move(master, "{} on {}".format(source, master), moves)
+
+    def rebalance(self, master: str, nodes: typing.List[str]) -> MoveProgress:
+        moves = self.plan_rebalance(self.placements(master), nodes)
+        return self.move(master, "rebalance on {}".format(master), moves)
+
+    def placements(self, master: str) -> typing.Dict[int, typing.Set[str]]:
+        rows = self.db_handler.fetch_query(
+            master, self.master_service, PLACEMENTS_QUERY, {"port": self.port}
+        )
+        holders: typing.Dict[int, typing.Set[str]] = defaultdict(set)
+        for shard, node in rows:
+            holders[shard].add(node)
+        return holders
+
+    @staticmethod
+    def plan_drain(
+        holders: typing.Dict[int, typing.Set[str]],
+        source: str,
+        targets: typing.List[str],
+    ) -> typing.List[ShardMove]:
+        load = ShardMover.load(holders, targets)
+        moves = []
+        for shard, nodes in sorted(holders.items()):
+            if source not in nodes:
+                continue
+            candidates = [target for target in targets if target not in nodes]
+            if not candidates:
+                log.error("No target left for shard %s on %s", shard, source)
+                continue
+            target = min(candidates, key=lambda node: (load[node], node))
+            load[target] += 1
+            moves.append(ShardMove(shard, source, target))
+        return moves
+
+    @staticmethod
+    def plan_rebalance(
+        holders: typing.Dict[int, typing.Set[str]], nodes: typing.List[str]
+    ) -> typing.List[ShardMove]:
+        load = ShardMover.load(holders, nodes)
+        holders = {shard: set(holding) for shard, holding in holders.items()}
+        moves = []
+        while nodes:
+            source = max(nodes, key=lambda node: (load[node], node))
+            target = min(nodes, key=lambda node: (load[node], node))
+            if load[source] - load[target] <= 1:
+                break
+            shard = next(
+                (
+                    shard
+                    for shard, holding in sorted(holders.items())
+                    if source in holding and target not in holding
+                ),
+                None,
+            )
+            if shard is None:
+                break
+            holders[shard] ^= {source, target}
+            load[source] -= 1
+            load[target] += 1
+            moves.append(ShardMove(shard, source, target))
+        return moves
+
+    @staticmethod
+    def load(
+        holders: typing.Dict[int, typing.Set[str]], nodes: typing.List[str]
+    ) -> typing.Dict[str, int]:
+        load = {node: 0 for node in nodes}
+        for holding in holders.values():
+            for node in holding & load.keys():
+                load[node] += 1
+        return load
+
+    def move(
+        self, master: str, name: str, moves: typing.List[ShardMove]
+    ) -> MoveProgress:
+        progress = self.progress[name] = MoveProgress(name, len(moves))
+        try:
+            self.run_moves(master, name, moves, progress)
+        finally:
+            progress.finish()
+            self.prune()
+        return progress
+
+    def run_moves(
+        self,
+        master: str,
+        name: str,
+        moves: typing.List[ShardMove],
+        progress: MoveProgress,
+    ) -> None:
+        if not moves:
+            return
+        deadline = time.monotonic() + self.timeout
+        by_shard = {str(move.shard): move for move in moves}
+
+        def move_shard(shard: str) -> None:
+            if time.monotonic() > deadline:
+                progress.update(False)
+                raise TaskTimeoutError("Moving shards for {} timed out".format(name))
+            move = by_shard[shard]
+            try:
+                self.db_handler.execute_query(
+                    master,
+                    self.master_service,
+                    MOVE_SHARD_QUERY,
+                    {
+                        "shard": move.shard,
+                        "source": move.source,
+                        "target": move.target,
+                        "port": self.port,
+                    },
+                )
+            except Exception:
+                progress.update(False)
+                raise
+            progress.update(True)
+
+        self.executor.run(move_shard, list(by_shard))
+        log.info("Moving shards for %s finished: %s", name, progress.snapshot())
+
+    def prune(self) -> None:
+        finished = sorted(
+            (progress.finished, name)
+            for name, progress in list(self.progress.items())
+            if progress.finished is not None
+        )
+        for _, name in finished[: max(0, len(finished) - self.history)]:
+            self.progress.pop(name, None)
+
+    def move_progress(self) -> typing.Dict[str, typing.Dict[str, float]]:
+        return {name: p.snapshot() for name, p in list(self.progress.items())}
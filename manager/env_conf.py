@@ -20,6 +20,46 @@ class EnvConf:
     minimum_workers: int
     short_url: bool
     ssl_mode: str
+    pool_max_size: int
+    pool_max_idle: float
+    master_parallelism: int
+    master_timeout: float
+    provision_parallelism: int
+    provision_timeout: float
+    master_setup_batch: bool
+    worker_setup_batch: bool
+    watch_interval: float
+    reconciler_threads: int
+    field_selector: str
+    reconcile_interval: float
+    disable_metrics: bool
+    coalesce_window: float
+    state_file: str
+    state_config_map: str
+    state_interval: float
+    queue_size: int
+    readiness_timeout: float
+    readiness_backoff: float
+    lease_name: str
+    lease_duration: float
+    lease_retry: float
+    drain_shards: bool
+    drain_parallelism: int
+    drain_timeout: float
+    rebalance_shards: bool
+    web_server: str
+    web_threads: int
+    web_waiters: int
+    web_host: str
+    circuit_failures: int
+    circuit_reset: float
+    circuit_max_reset: float
+    retry_budget: float
+    setup_templates: bool
+
+
+def parse_flag(value: str) -> bool:
+    return value.strip().lower() in ("1", "true", "yes")
 
 
 def parse_env_vars() -> EnvConf:
@@ -37,6 +77,42 @@ def parse_env_vars() -> EnvConf:
         int(env.get("MINIMUM_WORKERS", 0)),
         bool(env.get("SHORT_URL", False)),
         env.get("SSL_MODE", ""),
+        int(env.get("POOL_MAX_SIZE", 4)),
+        float(env.get("POOL_MAX_IDLE", 300)),
+        int(env.get("MASTER_PARALLELISM", 8)),
+        float(env.get("MASTER_TIMEOUT", 60)),
+        int(env.get("PROVISION_PARALLELISM", 10)),
+        float(env.get("PROVISION_TIMEOUT", 600)),
+        parse_flag(env.get("MASTER_SETUP_BATCH", "")),
+        parse_flag(env.get("WORKER_SETUP_BATCH", "")),
+        float(env.get("WATCH_INTERVAL", 5)),
+        int(env.get("RECONCILER_THREADS", 16)),
+        env.get("FIELD_SELECTOR", ""),
+        float(env.get("RECONCILE_INTERVAL", 60)),
+        parse_flag(env.get("DISABLE_METRICS", "")),
+        float(env.get("COALESCE_WINDOW", 0.2)),
+        env.get("STATE_FILE", ""),
+        env.get("STATE_CONFIG_MAP", ""),
+        float(env.get("STATE_INTERVAL", 10)),
+        int(env.get("QUEUE_SIZE", 1000)),
+        float(env.get("READINESS_TIMEOUT", 300)),
+        float(env.get("READINESS_BACKOFF", 0.1)),
+        env.get("LEASE_NAME", ""),
+        float(env.get("LEASE_DURATION", 15)),
+        float(env.get("LEASE_RETRY", 1)),
+        parse_flag(env.get("DRAIN_SHARDS", "")),
+        int(env.get("DRAIN_PARALLELISM", 4)),
+        float(env.get("DRAIN_TIMEOUT", 600)),
+        parse_flag(env.get("REBALANCE_SHARDS", "")),
+        env.get("WEB_SERVER", "waitress"),
+        int(env.get("WEB_THREADS", 16)),
+        int(env.get("WEB_WAITERS", 8)),
+        env.get("WEB_HOST", "127.0.0.1"),
+        int(env.get("CIRCUIT_FAILURES", 3)),
+        float(env.get("CIRCUIT_RESET", 5)),
+        float(env.get("CIRCUIT_MAX_RESET", 60)),
+        float(env.get("RETRY_BUDGET", 20)),
+        parse_flag(env.get("SETUP_TEMPLATES", "")),
     )
     log.info("Environment Config: %s", conf)
     return conf
@@ -0,0 +1,190 @@
+import typing
+import datetime
+import logging
+import time
+
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from threading import Event, Lock, Thread
+from kubernetes import client
+from kubernetes.client.rest import ApiException
+
+log = logging.getLogger(__file__)
+
+CONFLICT = 409
+NOT_FOUND = 404
+
+
+@dataclass
+class LeaseRecord:
+    holder: str
+    duration: float
+    version: str = ""
+
+
+class LeaseStore(ABC):
+    @abstractmethod
+    def get(self) -> typing.Optional[LeaseRecord]:
+        pass
+
+    @abstractmethod
+    def create(self, record: LeaseRecord) -> bool:
+        pass
+
+    @abstractmethod
+    def update(self, record: LeaseRecord) -> bool:
+        pass
+
+
+class KubernetesLeaseStore(LeaseStore):
+    def __init__(self, name: str, namespace: str) -> None:
+        self.name = name
+        self.namespace = namespace
+        # coordination.k8s.io/v1 is only available in newer clients
+        self.api: typing.Any
+        if hasattr(client, "CoordinationV1Api"):
+            self.api = client.CoordinationV1Api()
+            self.api_version = "coordination.k8s.io/v1"
+        else:
+            self.api = client.CoordinationV1beta1Api()
+            self.api_version = "coordination.k8s.io/v1beta1"
+
+    def get(self) -> typing.Optional[LeaseRecord]:
+        try:
+            lease = self.api.read_namespaced_lease(self.name, self.namespace)
+        except ApiException as e:
+            if e.status == NOT_FOUND:
+                return None
+            raise
+        spec = lease.spec
+        return LeaseRecord(
+            spec.holder_identity or "",
+            spec.lease_duration_seconds or 0,
+            lease.metadata.resource_version,
+        )
+
+    def create(self, record: LeaseRecord) -> bool:
+        try:
+            self.api.create_namespaced_lease(self.namespace, self.body(record))
+            return True
+        except ApiException as e:
+            if e.status == CONFLICT:
+                return False
+            raise
+
+    def update(self, record: LeaseRecord) -> bool:
+        try:
+            self.api.replace_namespaced_lease(
+                self.name, self.namespace, self.body(record)
+            )
+            return True
+        except ApiException as e:
+            if e.status == CONFLICT:
+                return False
+            raise
+
+    def body(self, record: LeaseRecord) -> dict:
+        now = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        metadata = {"name": self.name, "namespace": self.namespace}
+        if record.version:
+            metadata["resourceVersion"] = record.version
+        return {
+            "apiVersion": self.api_version,
+            "kind": "Lease",
+            "metadata": metadata,
+            "spec": {
+                "holderIdentity": record.holder,
+                "leaseDurationSeconds": int(record.duration),
+                "renewTime": now,
+            },
+        }
+
+
+class LeaderElector:
+    def __init__(
+        self,
+        store: LeaseStore,
+        identity: str,
+        lease_duration: float = 15,
+        retry_period: float = 1,
+        on_started: typing.Callable[[], None] = lambda: None,
+        on_stopped: typing.Callable[[], None] = lambda: None,
+    ) -> None:
+        self.store = store
+        self.identity = identity
+        self.lease_duration = lease_duration
+        # Step down before a standby may consider the lease expired
+        self.renew_deadline = lease_duration * 2 / 3
+        self.retry_period = retry_period
+        self.on_started = on_started
+        self.on_stopped = on_stopped
+        self.leader = False
+        self.holder = ""
+        self.observed: typing.Optional[LeaseRecord] = None
+        self.observed_at = 0.0
+        self.renewed_at = 0.0
+        self.lock = Lock()
+        self.stopped = Event()
+
+    def is_leader(self) -> bool:
+        return self.leader
+
+    def start(self) -> None:
+        log.info("Starting leader election as %s", self.identity)
+        Thread(target=self.run, name="leader-election", daemon=True).start()
+
+    def run(self) -> None:
+        while not self.stopped.is_set():
+            self.step()
+            self.stopped.wait(self.retry_period)
+
+    def step(self) -> None:
+        try:
+            acquired = self.try_acquire_or_renew()
+        except Exception as e:
+            log.error("Error during leader election: %s", e)
+            acquired = False
+        now = time.monotonic()
+        if acquired:
+            self.renewed_at = now
+            self.set_leader(True)
+        elif not self.leader or now - self.renewed_at > self.renew_deadline:
+            self.set_leader(False)
+
+    def try_acquire_or_renew(self) -> bool:
+        record = self.store.get()
+        if record is None:
+            return self.store.create(LeaseRecord(self.identity, self.lease_duration))
+        now = time.monotonic()
+        if self.observed is None or self.observed != record:
+            self.observed = record
+            self.observed_at = now
+        self.holder = record.holder
+        expired = now - self.observed_at > record.duration
+        if record.holder and record.holder != self.identity and not expired:
+            return False
+        renewed = LeaseRecord(self.identity, self.lease_duration, record.version)
+        return self.store.update(renewed)
+
+    def set_leader(self, leader: bool) -> None:
+        with self.lock:
+            if leader == self.leader:
+                return
+            self.leader = leader
+        if leader:
+            log.info("%s became the leader", self.identity)
+            self.holder = self.identity
+            self.on_started()
+        else:
+            log.info("%s is no longer the leader", self.identity)
+            self.on_stopped()
+
+    def release(self) -> None:
+        self.stopped.set()
+        if not self.leader:
+            return
+        self.set_leader(False)
+        record = self.store.get()
+        if record is not None and record.holder == self.identity:
+            self.store.update(LeaseRecord("", self.lease_duration, record.version))
+            log.info("Released leadership of %s", self.identity)
@@ -1,15 +1,33 @@
 import typing
-import retrying
 import json
 import logging
+import functools
+import os
+import signal
+import socket
+import time
+import metrics
+import waitress
 
-from kubernetes import client, config, watch
+from kubernetes import client, config
 from kubernetes.client import V1Pod
-from flask import Flask
-from threading import Thread
+from flask import Flask, Response, request
+from threading import BoundedSemaphore, Thread, Lock
 from env_conf import parse_env_vars
 from db import DBHandler
 from config_monitor import ConfigMonitor, PodMonitorConfig
+from parallel import ParallelExecutor, TaskResult
+from reconciler import Reconciler, Job
+from pod_state import NodeSet, PodStateTable, is_pod_ready
+from pod_state import READY, DELETED, DRAINING
+from pod_cache import PodCache, PodInformer, EventStats
+from coalescer import Coalescer
+from readiness import ReadinessTracker
+from state import create_state_store
+from leader import KubernetesLeaseStore, LeaderElector
+from drain import ShardMover
+from snapshot import VersionedSnapshot
+from circuit_breaker import CLOSED
 
 
 logging.basicConfig(
@@ -20,9 +38,19 @@ logging.basicConfig(
 
 log = logging.getLogger(__file__)
 
+ADD_NODE_QUERY = "SELECT master_add_node(%(host)s, %(port)s)"
+REMOVE_NODE_QUERY = """DELETE FROM pg_dist_shard_placement
+    WHERE nodename=%(host)s AND nodeport=%(port)s;
+    SELECT master_remove_node(nodename, nodeport) FROM pg_dist_node
+    WHERE nodename=%(host)s AND nodeport=%(port)s"""
+REGISTERED_NODES_QUERY = "SELECT nodename, nodeport FROM pg_dist_node"
 
-class ReadinessError(Exception):
-    pass
+ADD = "ADD"
+REMOVE = "REMOVE"
+PROVISIONING = "provisioning"
+REBALANCE = "rebalance"
+# Request threads that long-polling and streaming clients can never occupy
+RESERVED_THREADS = 4
 
 
 class Manager:
@@ -32,65 +60,300 @@ class Manager:
     def __init__(self) -> None:
 
         self.conf = parse_env_vars()
+        if self.conf.disable_metrics:
+            metrics.disable()
         self.db_handler = DBHandler(self.conf)
+        self.master_executor = ParallelExecutor(
+            self.conf.master_parallelism, self.conf.master_timeout, "masters"
+        )
         self.init_provision = False
+        self.init_provision_lock = Lock()
+        self.reconciler = Reconciler(self.conf.reconciler_threads, self.conf.queue_size)
+        self.readiness = ReadinessTracker(
+            self.probe,
+            self.reconciler.submit_later,
+            self.conf.readiness_timeout,
+            self.conf.readiness_backoff,
+            self.give_up,
+        )
+        self.worker_updates = Coalescer(
+            self.conf.coalesce_window, self.apply_worker_updates
+        )
+        metrics.Gauge(
+            "citus_manager_queue_depth",
+            "Pod events waiting to be handled",
+            lambda: {(): self.reconciler.depth()},
+        )
+        metrics.Gauge(
+            "citus_manager_open_circuits",
+            "Hosts that are failed fast because their connections kept failing",
+            lambda: {
+                (): sum(
+                    circuit["state"] != CLOSED
+                    for circuit in self.db_handler.circuit_stats().values()
+                )
+            },
+        )
 
-        self.citus_master_nodes: typing.Set[str] = set()
-        self.citus_worker_nodes: typing.Set[str] = set()
+        self.shard_mover = ShardMover(
+            self.db_handler,
+            self.conf.master_service,
+            self.conf.pg_port,
+            self.conf.drain_parallelism,
+            self.conf.drain_timeout,
+        )
+        self.citus_master_nodes = NodeSet(self.refresh_registered)
+        self.citus_worker_nodes = NodeSet(self.refresh_registered)
+        self.registered = VersionedSnapshot(self.registered_nodes)
+        self.pod_states = PodStateTable()
+        self.pod_cache = PodCache(self.get_citus_type, self.read_pod)
+        self.event_stats = EventStats()
+        self.state_store = create_state_store(self.conf)
+        self.startup: typing.Dict[str, float] = {}
+        self.started = False
+        metrics.Gauge(
+            "citus_manager_startup_seconds",
+            "Duration of each startup phase",
+            lambda: {(phase,): value for phase, value in self.startup.items()},
+            ("phase",),
+        )
+        self.elector = self.create_elector()
+        metrics.Gauge(
+            "citus_manager_leader",
+            "1 if this replica is the leader and writes to the database",
+            lambda: {(): int(self.is_leader())},
+        )
+        self.resource_version = ""
+        self.last_checkpoint = ""
         self.start_web_server()
         self.pod_interactions: typing.Dict[
             str, typing.Dict[str, typing.Callable[[str], None]]
         ] = {
-            "ADDED": {
+            READY: {
                 self.conf.master_label: self.add_master,
                 self.conf.worker_label: self.add_worker,
             },
-            "DELETED": {
+            DELETED: {
                 self.conf.master_label: self.remove_master,
                 self.conf.worker_label: self.remove_worker,
             },
+            DRAINING: {self.conf.worker_label: self.drain_worker},
         }
         self.config_monitor = self.create_provision_monitor()
-        self.config_monitor.start_watchers()
+        self.start_reconcile_loop()
+        self.start_checkpoint_loop()
 
     def create_provision_monitor(self) -> ConfigMonitor:
         master_config = PodMonitorConfig(
             self.citus_master_nodes,
             self.config_path + "master.setup",
             self.conf.master_service,
+            self.conf.master_setup_batch,
         )
         worker_config = PodMonitorConfig(
             self.citus_worker_nodes,
             self.config_path + "worker.setup",
             self.conf.worker_service,
+            self.conf.worker_setup_batch,
         )
-        return ConfigMonitor(self.db_handler, master_config, worker_config)
+        return ConfigMonitor(
+            self.db_handler,
+            master_config,
+            worker_config,
+            self.conf.provision_parallelism,
+            self.conf.provision_timeout,
+            self.conf.watch_interval,
+            functools.partial(self.submit_as_leader, PROVISIONING),
+            self.conf.setup_templates,
+            self.pod_cache.lookup,
+        )
+
+    def create_elector(self) -> typing.Optional[LeaderElector]:
+        if not self.conf.lease_name:
+            return None
+        return LeaderElector(
+            KubernetesLeaseStore(self.conf.lease_name, self.conf.namespace),
+            socket.gethostname(),
+            self.conf.lease_duration,
+            self.conf.lease_retry,
+            on_started=lambda: self.reconciler.submit(PROVISIONING, self.take_over),
+        )
+
+    def is_leader(self) -> bool:
+        return self.elector is None or self.elector.is_leader()
+
+    def submit_as_leader(self, key: str, job: Job) -> None:
+        self.reconciler.submit(key, functools.partial(self.run_as_leader, job))
+
+    def run_as_leader(self, job: Job) -> None:
+        if self.is_leader():
+            job()
+
+    def take_over(self) -> None:
+        if not self.is_leader():
+            return
+        log.info("Taking over as leader, catching up with the cluster")
+        state = self.state_store.load() if self.state_store else None
+        if state:
+            self.config_monitor.ledger.restore(state["ledger"])
+        self.config_monitor.scripts.clear()
+        self.reconcile()
+        if len(self.citus_worker_nodes) >= self.conf.minimum_workers:
+            with self.init_provision_lock:
+                self.config_monitor.provision_all_nodes()
+                self.init_provision = True
+
+    def read_pod(self, pod_name: str) -> V1Pod:
+        return client.CoreV1Api().read_namespaced_pod(pod_name, self.conf.namespace)
 
     @staticmethod
     def get_citus_type(pod: V1Pod) -> str:
         labels = pod.metadata.labels
-        log.info("Retrieved labels: %s", labels)
+        log.debug("Retrieved labels: %s", labels)
         if not labels:
             return ""
         return labels.get("citusType", "")
 
     def run(self) -> None:
         log.info("Starting to watch citus db pods in {}".format(self.conf.namespace))
-
+        start = time.monotonic()
         config.load_incluster_config()  # or load_kube_config for external debugging
+        self.startup["kube_config"] = round(time.monotonic() - start, 3)
+        # The remaining phases are independent of each other
+        phases: typing.Dict[str, typing.Callable[[], typing.Any]] = {
+            "state": self.restore_state,
+            "scripts": self.config_monitor.prime_scripts,
+            "file_watchers": self.config_monitor.start_watchers,
+        }
+        results = ParallelExecutor(len(phases), 60, "startup").run(
+            lambda phase: phases[phase](), list(phases)
+        )
+        for phase, result in results.items():
+            self.startup[phase] = round(result.duration, 3)
+        for phase, result in results.items():
+            if result.error is not None:
+                log.error("Startup phase %s failed", phase)
+                raise result.error
+        Thread(target=self.prewarm, daemon=True).start()
         api = client.CoreV1Api()
-        w = watch.Watch()
-        for event in w.stream(api.list_namespaced_pod, self.conf.namespace):
-            citus_type, pod_name, event_type = self.parse_event(event)
-            if not citus_type or event_type not in self.pod_interactions:
-                continue
-            handler = self.pod_interactions[event_type]
-            if citus_type not in handler:
+        if self.elector is not None:
+            signal.signal(signal.SIGTERM, self.shutdown)
+            self.elector.start()
+        self.started = True
+        self.startup["total"] = round(time.monotonic() - start, 3)
+        log.info("Started in %ss: %s", self.startup["total"], self.startup)
+        self.watch_pods(api.list_namespaced_pod, results["state"].value or "")
+
+    def prewarm(self) -> None:
+        start = time.monotonic()
+        masters = self.citus_master_nodes.snapshot()
+        self.master_executor.run(
+            lambda master: self.db_handler.probe(master, self.conf.master_service),
+            masters,
+        )
+        self.startup["prewarm"] = round(time.monotonic() - start, 3)
+        log.info("Opened connections to %s known masters", len(masters))
+
+    def watch_pods(
+        self,
+        list_pods: typing.Callable[..., typing.Any],
+        resource_version: typing.Optional[str] = None,
+    ) -> None:
+        if resource_version is None:
+            resource_version = self.restore_state()
+        start = time.monotonic()
+
+        def timed_list(*args: typing.Any, **kwargs: typing.Any) -> typing.Any:
+            pod_list = list_pods(*args, **kwargs)
+            if not kwargs.get("watch") and "initial_list" not in self.startup:
+                self.startup["initial_list"] = round(time.monotonic() - start, 3)
+            return pod_list
+
+        informer = PodInformer(
+            timed_list,
+            self.conf.namespace,
+            self.pod_cache,
+            self.event_stats,
+            self.label_selector(),
+            self.conf.field_selector,
+            resource_version=resource_version,
+        )
+        self.reconciler.run(informer.stream(), self.route_event)
+
+    def is_ready(self) -> bool:
+        return self.started and self.pod_cache.synced and self.reconciler.running()
+
+    def shutdown(self, signum: int, frame: typing.Any) -> None:
+        log.info("Received signal %s, shutting down", signum)
+        if self.elector is not None:
+            self.elector.release()
+        os._exit(0)
+
+    def label_selector(self) -> str:
+        return "citusType in ({},{})".format(
+            self.conf.master_label, self.conf.worker_label
+        )
+
+    def route_event(self, event: dict) -> typing.Optional[typing.Tuple[str, Job]]:
+        citus_type, pod_name, event_type = self.parse_event(event)
+        if not citus_type:
+            return None
+        pod = event["object"]
+        if not event.get("resync"):
+            self.resource_version = pod.metadata.resource_version or ""
+        transition = self.pod_states.observe(
+            event_type,
+            pod_name,
+            is_pod_ready(pod),
+            citus_type,
+            self.resource_version,
+            pod.metadata.deletion_timestamp is not None,
+            pod.metadata.uid or "",
+        )
+        if transition != READY and not self.pod_states.is_ready(pod_name):
+            self.readiness.cancel(pod_name)
+        if transition not in self.pod_interactions:
+            return None
+        handler = self.pod_interactions[transition]
+        if citus_type not in handler:
+            if transition != DRAINING:
                 log.error("Not recognized citus type %s", citus_type)
-            try:
-                handler[citus_type](pod_name)
-            except ReadinessError as e:
-                log.error(e)
+            return None
+        self.event_stats.acted += 1
+        job: Job = functools.partial(handler[citus_type], pod_name)
+        if transition == READY:
+            start = time.monotonic()
+            if citus_type == self.conf.worker_label:
+                # Registered in a later batch, apply_worker_updates observes it
+                job = functools.partial(self.add_worker, pod_name, start)
+            else:
+                job = functools.partial(self.timed, job, citus_type, start)
+            job = self.readiness.start(pod_name, citus_type, job)
+        return pod_name, job
+
+    def give_up(self, pod_name: str) -> None:
+        # The next watch event or reconciliation checks the pod again
+        self.reconciler.call_soon(functools.partial(self.pod_states.reset, pod_name))
+
+    def retry_pending(self) -> None:
+        for pod_name in self.pod_states.pending():
+            pod = self.pod_cache.get(pod_name)
+            if pod is not None and is_pod_ready(pod):
+                self.reconciler.resync(
+                    {"type": "MODIFIED", "object": pod, "resync": True}
+                )
+
+    def probe(self, pod_name: str, citus_type: str) -> bool:
+        if citus_type == self.conf.master_label:
+            return self.db_handler.probe(pod_name, self.conf.master_service)
+        return self.db_handler.probe(pod_name, self.conf.worker_service)
+
+    @staticmethod
+    def timed(job: Job, citus_type: str, start: float) -> None:
+        job()
+        metrics.REGISTRATION_LATENCY.observe(
+            time.monotonic() - start, citus_type=citus_type
+        )
 
     def parse_event(self, event: dict) -> typing.Tuple[str, str, str]:
         event_type = event["type"]
@@ -106,84 +369,393 @@ class Manager:
             )
         return citus_type, pod_name, event_type
 
-    def check_pod_readiness(self, pod_name: str) -> None:
-        @retrying.retry(
-            wait_fixed=5000,
-            retry_on_exception=lambda x: not isinstance(x, client.rest.ApiException),
-        )
-        def request_pod_readiness():
-            api = client.CoreV1Api()
-            pod = api.read_namespaced_pod_status(pod_name, self.conf.namespace)
-            status = pod.status
-            readiness = [state.ready for state in status.container_statuses]
-            log.info("Status: %s, %s", pod_name, readiness)
-            assert all(readiness)
-            log.info("Pod %s ready", pod_name)
+    def registered_nodes(self) -> dict:
+        return {
+            "workers": self.citus_worker_nodes.snapshot(),
+            "masters": self.citus_master_nodes.snapshot(),
+        }
 
-        try:
-            request_pod_readiness()
-        except client.rest.ApiException as e:
-            log.info("Error while waiting for pod readiness: %s", pod_name)
-            raise ReadinessError(e)
+    def refresh_registered(self) -> None:
+        self.registered.refresh()
 
     def start_web_server(self) -> None:
         app = Flask(__name__)
+        waiters = BoundedSemaphore(
+            max(0, min(self.conf.web_waiters, self.conf.web_threads - RESERVED_THREADS))
+        )
+
+        def busy() -> Response:
+            return Response(status=503, headers={"Retry-After": "5"})
 
         @app.route("/registered")
-        def registered_workers() -> str:
-            pods = {
-                "workers": list(self.citus_worker_nodes),
-                "masters": list(self.citus_master_nodes),
-            }
-            return json.dumps(pods)
+        def registered_workers() -> Response:
+            generation, body = self.registered.get()
+            wait = request.args.get("wait", type=int)
+            if wait is not None and wait == generation:
+                if not waiters.acquire(blocking=False):
+                    return busy()
+                timeout = request.args.get("timeout", 30.0, type=float)
+                try:
+                    generation, body = self.registered.wait(wait, min(timeout, 300))
+                finally:
+                    waiters.release()
+            etag = '"{}"'.format(generation)
+            headers = {"ETag": etag, "X-Generation": str(generation)}
+            if etag in request.headers.get("If-None-Match", ""):
+                return Response(status=304, headers=headers)
+            return Response(body, headers=headers, mimetype="application/json")
+
+        @app.route("/registered/events")
+        def registered_events() -> Response:
+            def stream() -> typing.Iterator[str]:
+                generation, body = self.registered.get()
+                yield "id: {}\ndata: {}\n\n".format(generation, body)
+                while True:
+                    current, body = self.registered.wait(generation, 15)
+                    if current == generation:
+                        yield ": keep-alive\n\n"
+                        continue
+                    generation = current
+                    yield "id: {}\ndata: {}\n\n".format(generation, body)
+
+            if not waiters.acquire(blocking=False):
+                return busy()
+            response = Response(stream(), mimetype="text/event-stream")
+            response.call_on_close(waiters.release)
+            return response
+
+        @app.route("/ready")
+        def ready() -> typing.Tuple[str, int]:
+            status = {"ready": self.is_ready(), "startup": self.startup}
+            return json.dumps(status), 200 if status["ready"] else 503
+
+        @app.route("/healthz")
+        def healthz() -> typing.Tuple[str, int]:
+            alive = not self.reconciler.stopped
+            return json.dumps({"alive": alive}), 200 if alive else 500
+
+        @app.route("/metrics")
+        def metrics_endpoint() -> typing.Tuple[str, int, dict]:
+            return metrics.render(), 200, {"Content-Type": metrics.CONTENT_TYPE}
+
+        @app.route("/events")
+        def event_stats() -> str:
+            return json.dumps(self.event_stats.as_dict())
+
+        @app.route("/pending")
+        def pending_pods() -> str:
+            return json.dumps(self.pod_states.pending() + self.readiness.waiting())
+
+        @app.route("/pool")
+        def pool_stats() -> str:
+            return json.dumps(self.db_handler.pool_stats())
 
-        Thread(target=app.run).start()
+        @app.route("/circuits")
+        def circuits() -> str:
+            return json.dumps(self.db_handler.circuit_stats())
+
+        @app.route("/provisioning")
+        def provision_progress() -> str:
+            return json.dumps(self.config_monitor.provision_progress())
+
+        @app.route("/ledger")
+        def provision_ledger() -> str:
+            return json.dumps(self.config_monitor.ledger.snapshot())
+
+        @app.route("/shard-moves")
+        def shard_moves() -> str:
+            return json.dumps(self.shard_mover.move_progress())
+
+        @app.route("/leader")
+        def leader() -> str:
+            elector = self.elector
+            return json.dumps(
+                {
+                    "identity": elector.identity if elector else "",
+                    "holder": elector.holder if elector else "",
+                    "leader": self.is_leader(),
+                }
+            )
+
+        Thread(target=self.serve, args=(app,)).start()
+
+    def serve(self, app: Flask) -> None:
+        if self.conf.web_server == "flask":
+            app.run(host=self.conf.web_host, threaded=True)
+            return
+        waitress.serve(
+            app, host=self.conf.web_host, port=5000, threads=self.conf.web_threads
+        )
 
     def add_master(self, pod_name: str) -> None:
-        self.check_pod_readiness(pod_name)
         log.info("Registering new master %s", pod_name)
         self.citus_master_nodes.add(pod_name)
-        if len(self.citus_worker_nodes) >= self.conf.minimum_workers:
+        if not self.is_leader():
+            return
+        workers = self.citus_worker_nodes.snapshot()
+        if workers:
+            queries = [(ADD_NODE_QUERY, self.node_params(pod)) for pod in workers]
+            try:
+                self.exec_on_master(pod_name, queries)
+                log.info("Registered %s workers on %s", len(workers), pod_name)
+            except Exception as e:
+                log.error("Error while registering workers on %s: %s", pod_name, e)
+        if len(workers) >= self.conf.minimum_workers:
             self.config_monitor.provision_master(pod_name)
-        for worker_pod in self.citus_worker_nodes:
-            self.add_worker(worker_pod)
 
     def remove_master(self, pod_name: str) -> None:
         self.citus_master_nodes.discard(pod_name)
+        self.config_monitor.forget(pod_name)
+        self.db_handler.evict_host(pod_name, self.conf.master_service)
         log.info("Unregistered: %s", pod_name)
 
-    def add_worker(self, pod_name: str) -> None:
-        self.check_pod_readiness(pod_name)
+    def add_worker(self, pod_name: str, started: typing.Optional[float] = None) -> None:
         log.info("Registering new worker %s", pod_name)
         self.citus_worker_nodes.add(pod_name)
-
-        self.exec_on_masters("SELECT master_add_node(%(host)s, %(port)s)", pod_name)
-        if len(self.citus_worker_nodes) >= self.conf.minimum_workers:
-            if not self.init_provision:
-                self.config_monitor.provision_all_nodes()
-                self.init_provision = True
-            else:
-                self.config_monitor.provision_worker(pod_name)
+        self.worker_updates.submit(pod_name, ADD, started)
 
     def remove_worker(self, worker_name: str) -> None:
         log.info("Worker terminated: %s", worker_name)
         self.citus_worker_nodes.discard(worker_name)
-        self.exec_on_masters(
-            """DELETE FROM pg_dist_shard_placement WHERE nodename=%(host)s AND nodeport=%(port)s;
-            SELECT master_remove_node(%(host)s, %(port)s)""",
-            worker_name,
-        )
-        log.info("Unregistered: %s", worker_name)
+        self.config_monitor.forget(worker_name)
+        self.worker_updates.submit(worker_name, REMOVE)
 
-    def exec_on_masters(self, query: str, worker_name: str) -> None:
-        for master in self.citus_master_nodes:
-            worker_host = self.db_handler.get_host_name(
-                worker_name, self.conf.worker_service
-            )
-            query_params = {"host": worker_host, "port": self.conf.pg_port}
-            self.db_handler.execute_query(
-                master, self.conf.master_service, query, query_params
+    def drain_worker(self, worker_name: str) -> None:
+        self.citus_worker_nodes.discard(worker_name)
+        if self.conf.drain_shards and self.is_leader():
+            source = self.worker_host(worker_name)
+            targets = [self.worker_host(w) for w in self.citus_worker_nodes.snapshot()]
+            log.info("Draining %s before removal", worker_name)
+            for master in self.citus_master_nodes.snapshot():
+                try:
+                    self.shard_mover.drain(master, source, targets)
+                except Exception as e:
+                    log.error("Error while draining %s on %s: %s", source, master, e)
+        self.remove_worker(worker_name)
+
+    def rebalance(self) -> None:
+        nodes = [self.worker_host(w) for w in self.citus_worker_nodes.snapshot()]
+        for master in self.citus_master_nodes.snapshot():
+            try:
+                self.shard_mover.rebalance(master, nodes)
+            except Exception as e:
+                log.error("Error while rebalancing shards on %s: %s", master, e)
+
+    def apply_worker_updates(
+        self, updates: typing.Dict[str, str], submitted: typing.Dict[str, float]
+    ) -> None:
+        added = [pod for pod, update in updates.items() if update == ADD]
+        removed = [pod for pod, update in updates.items() if update == REMOVE]
+        queries = [(REMOVE_NODE_QUERY, self.node_params(pod)) for pod in removed]
+        queries += [(ADD_NODE_QUERY, self.node_params(pod)) for pod in added]
+        if self.is_leader():
+            self.exec_on_masters(queries)
+        registered = time.monotonic()
+        for worker_name in added:
+            metrics.REGISTRATION_LATENCY.observe(
+                registered - submitted[worker_name], citus_type=self.conf.worker_label
             )
+        for worker_name in removed:
+            self.db_handler.evict_host(worker_name, self.conf.worker_service)
+            log.info("Unregistered: %s", worker_name)
+        if added:
+            provision = functools.partial(self.provision_workers, added)
+            self.reconciler.submit(PROVISIONING, provision)
+        if added and self.conf.rebalance_shards:
+            self.submit_as_leader(REBALANCE, self.rebalance)
+
+    def provision_workers(self, pod_names: typing.List[str]) -> None:
+        if not self.is_leader():
+            return
+        if len(self.citus_worker_nodes) < self.conf.minimum_workers:
+            return
+        with self.init_provision_lock:
+            initial = not self.init_provision
+            if initial:
+                self.config_monitor.provision_all_nodes()
+                self.init_provision = True
+        if not initial:
+            self.config_monitor.provision_workers(pod_names)
+
+    def exec_on_masters(
+        self, queries: typing.List[typing.Tuple[str, dict]]
+    ) -> typing.Dict[str, TaskResult]:
+        def execute(master: str) -> None:
+            self.exec_on_master(master, queries)
+
+        masters = self.citus_master_nodes.snapshot()
+        results = self.master_executor.run(execute, masters)
+        failed = [master for master, result in results.items() if not result.ok]
+        if failed:
+            log.error("Queries %s failed on masters: %s", queries, failed)
+        return results
+
+    def exec_on_master(
+        self, master: str, queries: typing.List[typing.Tuple[str, dict]]
+    ) -> None:
+        try:
+            self.db_handler.execute_batch(master, self.conf.master_service, queries)
+        except Exception as e:
+            if len(queries) == 1:
+                raise
+            log.info("Batch failed on %s (%s), retrying one by one", master, e)
+            self.exec_each(master, queries)
+
+    def exec_each(
+        self, master: str, queries: typing.List[typing.Tuple[str, dict]]
+    ) -> None:
+        errors = []
+        for query, params in queries:
+            try:
+                self.db_handler.execute_query(
+                    master, self.conf.master_service, query, params
+                )
+            except Exception as e:
+                errors.append(e)
+        if errors:
+            raise errors[0]
+
+    def node_params(self, worker_name: str) -> dict:
+        return {"host": self.worker_host(worker_name), "port": self.conf.pg_port}
+
+    def worker_host(self, worker_name: str) -> str:
+        return self.db_handler.get_host_name(worker_name, self.conf.worker_service)
+
+    def start_reconcile_loop(self) -> None:
+        interval = self.conf.reconcile_interval
+        if not interval:
+            return
+
+        def run() -> None:
+            while True:
+                time.sleep(interval)
+                self.reconciler.submit("reconcile", self.reconcile)
+
+        Thread(target=run, daemon=True).start()
+
+    def reconcile(self) -> None:
+        if not self.is_leader():
+            return
+        if not self.pod_cache.synced:
+            log.info("Pod cache not synced yet, skipping reconciliation")
+            return
+        self.retry_pending()
+        ready = {self.worker_host(pod) for pod in self.citus_worker_nodes.snapshot()}
+        known = ready | {
+            self.worker_host(pod)
+            for pod in self.pod_cache.names(self.conf.worker_label)
+        }
+
+        def reconcile_master(master: str) -> typing.Tuple[int, int]:
+            return self.reconcile_master(master, ready, known)
+
+        results = self.master_executor.run(
+            reconcile_master, self.citus_master_nodes.snapshot()
+        )
+        for master, result in results.items():
+            if result.ok and any(result.value):
+                log.info("Reconciled %s, added %s, removed %s", master, *result.value)
+
+    def reconcile_master(
+        self, master: str, ready: typing.Set[str], known: typing.Set[str]
+    ) -> typing.Tuple[int, int]:
+        rows = self.db_handler.fetch_query(
+            master, self.conf.master_service, REGISTERED_NODES_QUERY
+        )
+        registered = {host for host, port in rows if port == self.conf.pg_port}
+        missing = ready - registered
+        stale = {
+            host
+            for host in registered - known
+            if self.db_handler.is_service_host(host, self.conf.worker_service)
+        }
+        for query, hosts in ((ADD_NODE_QUERY, missing), (REMOVE_NODE_QUERY, stale)):
+            for host in hosts:
+                self.db_handler.execute_query(
+                    master,
+                    self.conf.master_service,
+                    query,
+                    {"host": host, "port": self.conf.pg_port},
+                )
+        return len(missing), len(stale)
+
+    def start_checkpoint_loop(self) -> None:
+        interval = self.conf.state_interval
+        if self.state_store is None or not interval:
+            return
+
+        def run() -> None:
+            while True:
+                time.sleep(interval)
+                try:
+                    self.checkpoint()
+                except Exception as e:
+                    log.error("Error while saving state: %s", e)
+
+        Thread(target=run, daemon=True).start()
+
+    def idle(self) -> bool:
+        return self.reconciler.idle() and self.worker_updates.idle()
+
+    def checkpoint(self) -> bool:
+        if self.state_store is None or not self.pod_cache.synced:
+            return False
+        if not self.is_leader() or not self.idle():
+            return False
+        state = self.snapshot_state()
+        serialized = json.dumps(state, sort_keys=True)
+        if serialized == self.last_checkpoint or not self.idle():
+            return False
+        self.state_store.save(state)
+        self.last_checkpoint = serialized
+        log.debug("Saved state at resource version %s", state["resource_version"])
+        return True
+
+    def snapshot_state(self) -> dict:
+        return {
+            "resource_version": self.resource_version,
+            "masters": self.citus_master_nodes.snapshot(),
+            "workers": self.citus_worker_nodes.snapshot(),
+            "init_provision": self.init_provision,
+            "pods": self.pod_states.snapshot(),
+            "ledger": self.config_monitor.ledger.snapshot(),
+        }
+
+    def restore_state(self) -> str:
+        if self.state_store is None:
+            return ""
+        try:
+            state = self.state_store.load()
+        except Exception as e:
+            log.error("Could not load state, starting from scratch: %s", e)
+            return ""
+        if not state:
+            return ""
+        self.citus_master_nodes.update(state["masters"])
+        self.citus_worker_nodes.update(state["workers"])
+        self.init_provision = state["init_provision"]
+        self.pod_states.restore(state["pods"])
+        self.pod_cache.restore(
+            {
+                pod: (
+                    entry["citus_type"],
+                    entry["resource_version"],
+                    entry.get("uid", ""),
+                )
+                for pod, entry in state["pods"].items()
+            }
+        )
+        self.config_monitor.ledger.restore(state["ledger"])
+        if self.init_provision:
+            provision = self.config_monitor.provision_all_nodes
+            self.submit_as_leader(PROVISIONING, provision)
+        log.info(
+            "Restored %s masters and %s workers at resource version %s",
+            len(state["masters"]),
+            len(state["workers"]),
+            state["resource_version"],
+        )
+        return state["resource_version"]
 
 
 if __name__ == "__main__":
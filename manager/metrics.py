@@ -0,0 +1,215 @@
+import typing
+import time
+
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Lock
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+    300.0,
+)
+
+LabelValues = typing.Tuple[str, ...]
+
+
+class Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, description: str, labels: typing.Tuple = ()) -> None:
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.lock = Lock()
+        REGISTRY.append(self)
+
+    def label_values(self, labels: typing.Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def format_labels(self, values: LabelValues, extra: str = "") -> str:
+        pairs = [
+            '{}="{}"'.format(label, value.replace("\\", "\\\\").replace('"', '\\"'))
+            for label, value in zip(self.labels, values)
+        ]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> typing.List[str]:
+        header = [
+            "# HELP {} {}".format(self.name, self.description),
+            "# TYPE {} {}".format(self.name, self.kind),
+        ]
+        return header + self.samples()
+
+    @abstractmethod
+    def samples(self) -> typing.List[str]:
+        pass
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labels: typing.Tuple = ()) -> None:
+        super().__init__(name, description, labels)
+        self.values: typing.Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        if not ENABLED:
+            return
+        key = self.label_values(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self) -> typing.List[str]:
+        with self.lock:
+            values = list(self.values.items())
+        return [
+            "{}{} {}".format(self.name, self.format_labels(key), value)
+            for key, value in values
+        ]
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        collect: typing.Callable[[], typing.Dict[LabelValues, float]],
+        labels: typing.Tuple = (),
+    ) -> None:
+        super().__init__(name, description, labels)
+        self.collect = collect
+
+    def samples(self) -> typing.List[str]:
+        return [
+            "{}{} {}".format(self.name, self.format_labels(key), value)
+            for key, value in self.collect().items()
+        ]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: typing.Tuple = (),
+        buckets: typing.Tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, description, labels)
+        self.buckets = buckets
+        self.counts: typing.Dict[LabelValues, typing.List[int]] = {}
+        self.sums: typing.Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        if not ENABLED:
+            return
+        key = self.label_values(labels)
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            counts[index] += 1
+            self.sums[key] = self.sums.get(key, 0.0) + value
+
+    @contextmanager
+    def time(self, **labels: str) -> typing.Iterator[None]:
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - start, **labels)
+
+    def samples(self) -> typing.List[str]:
+        with self.lock:
+            series = [(key, list(counts)) for key, counts in self.counts.items()]
+            sums = dict(self.sums)
+        lines = []
+        for key, counts in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="{}"'.format("+Inf" if bound == float("inf") else bound)
+                lines.append(
+                    "{}_bucket{} {}".format(
+                        self.name, self.format_labels(key, le), cumulative
+                    )
+                )
+            labels = self.format_labels(key)
+            lines.append("{}_sum{} {}".format(self.name, labels, sums[key]))
+            lines.append("{}_count{} {}".format(self.name, labels, cumulative))
+        return lines
+
+
+REGISTRY: typing.List[Metric] = []
+ENABLED = True
+
+
+def disable() -> None:
+    global ENABLED
+    ENABLED = False
+
+
+def render() -> str:
+    if not ENABLED:
+        return ""
+    lines: typing.List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+REGISTRATION_LATENCY = Histogram(
+    "citus_manager_registration_latency_seconds",
+    "Time from a pod event to the end of its registration",
+    ("citus_type",),
+)
+READINESS_WAIT = Histogram(
+    "citus_manager_readiness_wait_seconds",
+    "Time a pod was seen pending before it became ready",
+)
+READINESS_GIVE_UPS = Counter(
+    "citus_manager_readiness_give_ups_total",
+    "Ready pods whose database did not answer before the readiness timeout",
+    ("citus_type",),
+)
+DB_CONNECT = Histogram(
+    "citus_manager_db_connect_seconds", "Time to open a pg connection", ("host",)
+)
+DB_QUERY = Histogram(
+    "citus_manager_db_query_seconds", "Time to run a query or script", ("host",)
+)
+PROVISION_NODE = Histogram(
+    "citus_manager_provision_node_seconds",
+    "Time to provision a single node",
+    ("service",),
+)
+PROVISION_FILE = Histogram(
+    "citus_manager_provision_file_seconds",
+    "Time to provision all nodes with a setup file",
+    ("file",),
+)
+WATCH_EVENTS = Counter(
+    "citus_manager_watch_events_total", "Pod watch events by type", ("type",)
+)
+RETRIES = Counter(
+    "citus_manager_retries_total", "Retried operations by operation", ("operation",)
+)
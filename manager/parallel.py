@@ -0,0 +1,83 @@
+import typing
+import logging
+import time
+
+from concurrent.futures import ThreadPoolExecutor, Future, TimeoutError
+from dataclasses import dataclass, field
+from threading import Event
+
+log = logging.getLogger(__file__)
+
+
+class TaskTimeoutError(Exception):
+    pass
+
+
+@dataclass
+class TaskResult:
+    target: str
+    value: typing.Any = None
+    error: typing.Optional[BaseException] = None
+    duration: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+@dataclass
+class _Task:
+    target: str
+    started: Event = field(default_factory=Event)
+    start_time: float = 0.0
+    future: typing.Optional[Future] = None
+
+    def run(self, fn: typing.Callable[[str], typing.Any]) -> typing.Any:
+        self.start_time = time.monotonic()
+        self.started.set()
+        return fn(self.target)
+
+
+class ParallelExecutor:
+    def __init__(self, parallelism: int, timeout: float, name: str = "") -> None:
+        self.parallelism = max(1, parallelism)
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.parallelism, thread_name_prefix=name or "parallel"
+        )
+
+    def run(
+        self, fn: typing.Callable[[str], typing.Any], targets: typing.Iterable[str]
+    ) -> typing.Dict[str, TaskResult]:
+        tasks = [_Task(target) for target in targets]
+        for task in tasks:
+            task.future = self.executor.submit(task.run, fn)
+        return {task.target: self._collect(task) for task in tasks}
+
+    def _collect(self, task: _Task) -> TaskResult:
+        assert task.future is not None
+        if not task.started.wait(self.timeout):
+            task.future.cancel()
+            return self._timed_out(task, "was not started")
+        remaining = task.start_time + self.timeout - time.monotonic()
+        try:
+            value = task.future.result(timeout=max(0.0, remaining))
+        except TimeoutError:
+            return self._timed_out(task, "did not finish")
+        except Exception as e:
+            log.error("Task on %s failed: %s", task.target, e)
+            return TaskResult(task.target, error=e, duration=self._elapsed(task))
+        return TaskResult(task.target, value=value, duration=self._elapsed(task))
+
+    def _timed_out(self, task: _Task, reason: str) -> TaskResult:
+        message = "Task on {} {} within {}s".format(task.target, reason, self.timeout)
+        log.error(message)
+        return TaskResult(
+            task.target, error=TaskTimeoutError(message), duration=self._elapsed(task)
+        )
+
+    @staticmethod
+    def _elapsed(task: _Task) -> float:
+        if not task.start_time:
+            return 0.0
+        return time.monotonic() - task.start_time
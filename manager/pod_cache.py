@@ -0,0 +1,252 @@
+import typing
+import logging
+import time
+
+from collections import defaultdict
+from dataclasses import dataclass, asdict
+from threading import Lock
+from kubernetes import watch
+from kubernetes.client import V1ObjectMeta, V1Pod
+from kubernetes.client.rest import ApiException
+from urllib3.exceptions import HTTPError
+from backoff import jittered_backoff
+from metrics import WATCH_EVENTS, RETRIES
+
+log = logging.getLogger(__file__)
+
+GONE = 410
+# The API server is overloaded or restarting, the watch is resumed after a backoff
+TRANSIENT = (408, 429, 500, 502, 503, 504)
+
+
+@dataclass
+class EventStats:
+    received: int = 0
+    changed: int = 0
+    acted: int = 0
+
+    def as_dict(self) -> typing.Dict[str, int]:
+        return asdict(self)
+
+
+class PodCache:
+    def __init__(
+        self,
+        get_citus_type: typing.Callable[[V1Pod], str],
+        read_pod: typing.Optional[typing.Callable[[str], V1Pod]] = None,
+    ) -> None:
+        self.get_citus_type = get_citus_type
+        self.read_pod = read_pod
+        self.pods: typing.Dict[str, V1Pod] = {}
+        self.by_type: typing.Dict[str, typing.Set[str]] = defaultdict(set)
+        # Restored pods that only carry the fields saved in the checkpoint
+        self.placeholders: typing.Set[str] = set()
+        self.synced = False
+        self.lock = Lock()
+
+    def apply(self, event_type: str, pod: V1Pod) -> bool:
+        name = pod.metadata.name
+        with self.lock:
+            cached = self.pods.get(name)
+            if event_type == "DELETED":
+                if cached is None:
+                    return False
+                self._remove(name, cached)
+                return True
+            if cached is not None:
+                if cached.metadata.resource_version == pod.metadata.resource_version:
+                    if name in self.placeholders:
+                        self.placeholders.discard(name)
+                        self.pods[name] = pod
+                    return False
+                self._remove(name, cached)
+            self.pods[name] = pod
+            self.by_type[self.get_citus_type(pod)].add(name)
+            return True
+
+    def replaced(self, pod: V1Pod) -> typing.Optional[V1Pod]:
+        # A pod recreated under the same name, e.g. by a StatefulSet, gets a new uid
+        cached = self.pods.get(pod.metadata.name)
+        if cached is None or not cached.metadata.uid or not pod.metadata.uid:
+            return None
+        return cached if cached.metadata.uid != pod.metadata.uid else None
+
+    def restore(self, pods: typing.Dict[str, typing.Tuple[str, str, str]]) -> None:
+        for name, (citus_type, resource_version, uid) in pods.items():
+            metadata = V1ObjectMeta(
+                name=name,
+                labels={"citusType": citus_type},
+                resource_version=resource_version,
+                uid=uid or None,
+            )
+            self.apply("ADDED", V1Pod(metadata=metadata))
+            self.placeholders.add(name)
+
+    def get(self, name: str) -> typing.Optional[V1Pod]:
+        return self.pods.get(name)
+
+    def lookup(self, name: str) -> typing.Optional[V1Pod]:
+        """Like get, but reads a restored pod from the API before returning it."""
+        if name not in self.placeholders or self.read_pod is None:
+            return self.pods.get(name)
+        pod = self.read_pod(name)
+        self.fill(pod)
+        return pod
+
+    def fill(self, pod: V1Pod) -> None:
+        name = pod.metadata.name
+        with self.lock:
+            cached = self.pods.get(name)
+            if name not in self.placeholders or cached is None:
+                return
+            if cached.metadata.uid and cached.metadata.uid != pod.metadata.uid:
+                # Recreated in the meantime, the watch delivers the new pod
+                return
+            if self.get_citus_type(cached) != self.get_citus_type(pod):
+                return
+            # Keep the restored version so the watch still delivers newer changes
+            pod.metadata.resource_version = cached.metadata.resource_version
+            self.pods[name] = pod
+            self.placeholders.discard(name)
+
+    def names(self, citus_type: str) -> typing.List[str]:
+        return list(self.by_type.get(citus_type, ()))
+
+    def _remove(self, name: str, pod: V1Pod) -> None:
+        del self.pods[name]
+        self.placeholders.discard(name)
+        self.by_type[self.get_citus_type(pod)].discard(name)
+
+
+class PodInformer:
+    initial_backoff = 0.5
+    maximum_backoff = 30.0
+
+    def __init__(
+        self,
+        list_pods: typing.Callable[..., typing.Any],
+        namespace: str,
+        cache: PodCache,
+        stats: EventStats,
+        label_selector: str = "",
+        field_selector: str = "",
+        watch_timeout: int = 300,
+        resource_version: str = "",
+    ) -> None:
+        self.list_pods = list_pods
+        self.namespace = namespace
+        self.cache = cache
+        self.stats = stats
+        self.selectors = {
+            key: value
+            for key, value in (
+                ("label_selector", label_selector),
+                ("field_selector", field_selector),
+            )
+            if value
+        }
+        self.watch_timeout = watch_timeout
+        # A restored cache counts as synced once a short watch from its
+        # resource version ended without the version being expired
+        self.resume_timeout = 1
+        self.resource_version = resource_version
+
+    def stream(self) -> typing.Iterator[dict]:
+        failures = 0
+        while True:
+            resource_version = self.resource_version
+            try:
+                if not self.resource_version:
+                    yield from self.relist()
+                yield from self.watch()
+                failures = 0
+                continue
+            except ApiException as e:
+                if e.status == GONE:
+                    self.expire()
+                    continue
+                if e.status not in TRANSIENT:
+                    raise
+                error: Exception = e
+            except HTTPError as e:
+                # Dropped connections and read timeouts of the watch request
+                error = e
+            if self.resource_version != resource_version:
+                failures = 0
+            delay = jittered_backoff(
+                failures, self.initial_backoff, self.maximum_backoff
+            )
+            failures += 1
+            log.error(
+                "Pod watch failed (%s), resuming from resource version %s in %.1fs",
+                error,
+                self.resource_version or "<relist>",
+                delay,
+            )
+            RETRIES.inc(operation="pod_watch")
+            time.sleep(delay)
+
+    def relist(self) -> typing.Iterator[dict]:
+        pod_list = self.list_pods(self.namespace, **self.selectors)
+        listed = {pod.metadata.name: pod for pod in pod_list.items}
+        self.stats.received += len(listed)
+        WATCH_EVENTS.inc(len(listed), type="LISTED")
+        log.info(
+            "Listed %s pods at resource version %s",
+            len(listed),
+            pod_list.metadata.resource_version,
+        )
+        for name, pod in list(self.cache.pods.items()):
+            if name not in listed and self.cache.apply("DELETED", pod):
+                self.stats.changed += 1
+                yield {"type": "DELETED", "object": pod}
+        for name, pod in listed.items():
+            event_type = "MODIFIED" if name in self.cache.pods else "ADDED"
+            yield from self.apply(event_type, pod)
+        self.resource_version = pod_list.metadata.resource_version
+        self.cache.synced = True
+
+    def watch(self) -> typing.Iterator[dict]:
+        w = watch.Watch()
+        synced = self.cache.synced
+        for event in w.stream(
+            self.list_pods,
+            self.namespace,
+            resource_version=self.resource_version,
+            timeout_seconds=self.watch_timeout if synced else self.resume_timeout,
+            **self.selectors
+        ):
+            self.stats.received += 1
+            WATCH_EVENTS.inc(type=event["type"])
+            if event["type"] == "ERROR":
+                self.handle_error(event)
+                w.stop()
+                return
+            self.cache.synced = True
+            pod = event["object"]
+            self.resource_version = pod.metadata.resource_version
+            yield from self.apply(event["type"], pod)
+        self.cache.synced = True
+
+    def apply(self, event_type: str, pod: V1Pod) -> typing.Iterator[dict]:
+        replaced = self.cache.replaced(pod) if event_type != "DELETED" else None
+        if replaced is not None:
+            log.info("Pod %s was recreated", pod.metadata.name)
+            self.cache.apply("DELETED", replaced)
+            self.stats.changed += 1
+            yield {"type": "DELETED", "object": replaced}
+            event_type = "ADDED"
+        if self.cache.apply(event_type, pod):
+            self.stats.changed += 1
+            yield {"type": event_type, "object": pod}
+
+    def handle_error(self, event: dict) -> None:
+        status = event.get("raw_object") or {}
+        if status.get("code") == GONE:
+            self.expire()
+            return
+        raise ApiException(status=status.get("code"), reason=status.get("message"))
+
+    def expire(self) -> None:
+        log.info("Resource version %s expired, relisting", self.resource_version)
+        self.resource_version = ""
@@ -0,0 +1,152 @@
+import typing
+import logging
+import time
+
+from dataclasses import dataclass, asdict, replace
+from threading import Lock
+from kubernetes.client import V1Pod
+from metrics import READINESS_WAIT
+
+log = logging.getLogger(__file__)
+
+PENDING = "PENDING"
+READY = "READY"
+DELETED = "DELETED"
+DRAINING = "DRAINING"
+
+
+def is_pod_ready(pod: V1Pod) -> bool:
+    status = pod.status
+    if not status or not status.container_statuses:
+        return False
+    return all(state.ready for state in status.container_statuses)
+
+
+class NodeSet:
+    def __init__(self, on_change: typing.Callable[[], None] = lambda: None) -> None:
+        self.nodes: typing.Set[str] = set()
+        self.lock = Lock()
+        self.on_change = on_change
+
+    def add(self, pod_name: str) -> None:
+        with self.lock:
+            changed = pod_name not in self.nodes
+            self.nodes.add(pod_name)
+        if changed:
+            self.on_change()
+
+    def discard(self, pod_name: str) -> None:
+        with self.lock:
+            changed = pod_name in self.nodes
+            self.nodes.discard(pod_name)
+        if changed:
+            self.on_change()
+
+    def update(self, pod_names: typing.Iterable[str]) -> None:
+        with self.lock:
+            size = len(self.nodes)
+            self.nodes.update(pod_names)
+            changed = len(self.nodes) != size
+        if changed:
+            self.on_change()
+
+    def snapshot(self) -> typing.List[str]:
+        with self.lock:
+            return sorted(self.nodes)
+
+    def __contains__(self, pod_name: object) -> bool:
+        with self.lock:
+            return pod_name in self.nodes
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self.nodes)
+
+
+@dataclass
+class PodEntry:
+    state: str
+    citus_type: str = ""
+    resource_version: str = ""
+    registered: bool = False
+    uid: str = ""
+
+
+class PodStateTable:
+    def __init__(self) -> None:
+        self.states: typing.Dict[str, PodEntry] = {}
+        self.pending_since: typing.Dict[str, float] = {}
+
+    def observe(
+        self,
+        event_type: str,
+        pod_name: str,
+        ready: bool,
+        citus_type: str = "",
+        resource_version: str = "",
+        deleting: bool = False,
+        uid: str = "",
+    ) -> typing.Optional[str]:
+        entry = self.states.get(pod_name)
+        previous = entry.state if entry else None
+        registered = entry is not None and entry.registered
+        if event_type == "DELETED":
+            self.states.pop(pod_name, None)
+            self.pending_since.pop(pod_name, None)
+            return DELETED if registered else None
+        if event_type not in ("ADDED", "MODIFIED"):
+            return None
+        if deleting and registered:
+            self.states[pod_name] = PodEntry(
+                DRAINING, citus_type, resource_version, True, uid
+            )
+            if previous != DRAINING:
+                log.info("Pod %s is terminating", pod_name)
+                return DRAINING
+            return None
+        if previous == DRAINING:
+            return None
+        state = READY if ready else PENDING
+        self.states[pod_name] = PodEntry(
+            state, citus_type, resource_version, registered or ready, uid
+        )
+        if ready and previous != READY:
+            log.info("Pod %s became ready", pod_name)
+            since = self.pending_since.pop(pod_name, None)
+            if since is not None:
+                READINESS_WAIT.observe(time.monotonic() - since)
+            return READY
+        if not ready and previous != PENDING:
+            log.info("Pod %s is waiting for readiness", pod_name)
+            self.pending_since[pod_name] = time.monotonic()
+        return None
+
+    def reset(self, pod_name: str) -> bool:
+        entry = self.states.get(pod_name)
+        if entry is None or entry.state != READY:
+            return False
+        log.info("Pod %s is waiting for readiness again", pod_name)
+        self.states[pod_name] = replace(entry, state=PENDING)
+        self.pending_since[pod_name] = time.monotonic()
+        return True
+
+    def is_ready(self, pod_name: str) -> bool:
+        entry = self.states.get(pod_name)
+        return entry is not None and entry.state == READY
+
+    def pending(self) -> typing.List[str]:
+        entries = list(self.states.items())
+        return [pod for pod, entry in entries if entry.state == PENDING]
+
+    def snapshot(self) -> typing.Dict[str, dict]:
+        return {pod: asdict(entry) for pod, entry in list(self.states.items())}
+
+    def restore(self, entries: typing.Dict[str, dict]) -> None:
+        self.states = {
+            pod: PodEntry(**dict({"registered": entry["state"] == READY}, **entry))
+            for pod, entry in entries.items()
+        }
+        now = time.monotonic()
+        self.pending_since = {
+            pod: now for pod, entry in self.states.items() if entry.state == PENDING
+        }
@@ -0,0 +1,89 @@
+import typing
+import functools
+import logging
+import time
+
+from threading import Lock
+from metrics import READINESS_GIVE_UPS
+from backoff import jittered_backoff
+
+log = logging.getLogger(__file__)
+
+Job = typing.Callable[[], None]
+Probe = typing.Callable[[str, str], bool]
+Scheduler = typing.Callable[[str, Job, float], None]
+
+
+class Attempt:
+    def __init__(self, citus_type: str, on_ready: Job) -> None:
+        self.citus_type = citus_type
+        self.on_ready = on_ready
+        self.started = time.monotonic()
+        self.tries = 0
+
+
+class ReadinessTracker:
+    maximum_backoff = 5.0
+
+    def __init__(
+        self,
+        probe: Probe,
+        schedule_later: Scheduler,
+        timeout: float = 300,
+        initial_backoff: float = 0.1,
+        on_give_up: typing.Callable[[str], None] = lambda pod_name: None,
+    ) -> None:
+        self.probe = probe
+        self.schedule_later = schedule_later
+        self.timeout = timeout
+        self.initial_backoff = initial_backoff
+        self.on_give_up = on_give_up
+        self.attempts: typing.Dict[str, Attempt] = {}
+        self.lock = Lock()
+
+    def start(self, pod_name: str, citus_type: str, on_ready: Job) -> Job:
+        attempt = Attempt(citus_type, on_ready)
+        with self.lock:
+            self.attempts[pod_name] = attempt
+        return functools.partial(self.check, pod_name, attempt)
+
+    def cancel(self, pod_name: str) -> None:
+        with self.lock:
+            self.attempts.pop(pod_name, None)
+
+    def waiting(self) -> typing.List[str]:
+        with self.lock:
+            return list(self.attempts)
+
+    def check(self, pod_name: str, attempt: Attempt) -> None:
+        with self.lock:
+            if self.attempts.get(pod_name) is not attempt:
+                log.info("Readiness check of %s was cancelled", pod_name)
+                return
+        if self.probe(pod_name, attempt.citus_type):
+            if self.finish(pod_name, attempt):
+                attempt.on_ready()
+            return
+        waited = time.monotonic() - attempt.started
+        if waited >= self.timeout:
+            if self.finish(pod_name, attempt):
+                log.error("Giving up on %s after %.1fs", pod_name, waited)
+                READINESS_GIVE_UPS.inc(citus_type=attempt.citus_type)
+                self.on_give_up(pod_name)
+            return
+        backoff = jittered_backoff(
+            attempt.tries, self.initial_backoff, self.maximum_backoff
+        )
+        delay = min(backoff, self.timeout - waited)
+        attempt.tries += 1
+        log.info("Database of %s not reachable yet, retrying in %.2fs", pod_name, delay)
+        self.schedule_later(
+            pod_name, functools.partial(self.check, pod_name, attempt), delay
+        )
+
+    def finish(self, pod_name: str, attempt: Attempt) -> bool:
+        with self.lock:
+            if self.attempts.get(pod_name) is not attempt:
+                return False
+            del self.attempts[pod_name]
+            return True
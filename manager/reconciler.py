@@ -0,0 +1,150 @@
+import typing
+import asyncio
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread, Lock
+
+log = logging.getLogger(__file__)
+
+Job = typing.Callable[[], None]
+Router = typing.Callable[[dict], typing.Optional[typing.Tuple[str, Job]]]
+
+
+class StreamEnd:
+    def __init__(self, error: typing.Optional[BaseException] = None) -> None:
+        self.error = error
+
+
+class Reconciler:
+    def __init__(self, workers: int, queue_size: int = 0) -> None:
+        self.executor = ThreadPoolExecutor(
+            max_workers=max(1, workers), thread_name_prefix="reconciler"
+        )
+        self.queue_size = queue_size
+        self.pending: typing.Dict[str, asyncio.Queue] = {}
+        self.loop: typing.Optional[asyncio.AbstractEventLoop] = None
+        self.tasks: typing.Set[asyncio.Task] = set()
+        self.events: typing.Optional[asyncio.Queue] = None
+        self.deferred: typing.List[typing.Tuple[str, Job]] = []
+        self.stopped = False
+        self.lock = Lock()
+
+    def run(self, stream: typing.Iterable[dict], route: Router) -> None:
+        try:
+            asyncio.run(self._run(stream, route))
+        finally:
+            self.stopped = True
+
+    def running(self) -> bool:
+        return self.loop is not None and not self.stopped
+
+    async def _run(self, stream: typing.Iterable[dict], route: Router) -> None:
+        loop = asyncio.get_running_loop()
+        events: asyncio.Queue = asyncio.Queue(self.queue_size)
+        self.events = events
+        capacity = asyncio.Semaphore(self.queue_size) if self.queue_size else None
+        with self.lock:
+            self.loop = loop
+            deferred, self.deferred = self.deferred, []
+        for key, job in deferred:
+            self.dispatch(key, job)
+
+        def put(event: typing.Any) -> None:
+            # Blocks the watch stream while the queue is full
+            asyncio.run_coroutine_threadsafe(events.put(event), loop).result()
+
+        def read_stream() -> None:
+            try:
+                for event in stream:
+                    put(event)
+            except BaseException as e:
+                put(StreamEnd(e))
+            else:
+                put(StreamEnd())
+
+        Thread(target=read_stream, name="watch-stream", daemon=True).start()
+        while True:
+            event = await events.get()
+            if isinstance(event, StreamEnd):
+                break
+            routed = route(event)
+            if routed is None:
+                continue
+            key, job = routed
+            if capacity is None:
+                self.dispatch(key, job)
+                continue
+            await capacity.acquire()
+            self.dispatch(key, job, capacity.release)
+
+        if self.tasks:
+            await asyncio.wait(self.tasks)
+        if event.error is not None:
+            raise event.error
+
+    def depth(self) -> int:
+        queued = self.events.qsize() if self.events else 0
+        return queued + sum(queue.qsize() for queue in list(self.pending.values()))
+
+    def idle(self) -> bool:
+        return not self.pending and self.depth() == 0
+
+    def submit(self, key: str, job: Job) -> None:
+        with self.lock:
+            if self.loop is None:
+                log.info("Reconciler not running yet, deferring %s", key)
+                self.deferred.append((key, job))
+                return
+        self.loop.call_soon_threadsafe(self.dispatch, key, job)
+
+    def call_soon(self, callback: typing.Callable[[], typing.Any]) -> None:
+        """Runs the callback on the loop thread, next to the event routing."""
+        with self.lock:
+            loop = self.loop
+        if loop is not None:
+            loop.call_soon_threadsafe(callback)
+
+    def resync(self, event: dict) -> None:
+        """Routes the event again as if it came from the watch stream."""
+        with self.lock:
+            loop, events = self.loop, self.events
+        if loop is None or events is None:
+            return
+        asyncio.run_coroutine_threadsafe(events.put(event), loop)
+
+    def submit_later(self, key: str, job: Job, delay: float) -> None:
+        with self.lock:
+            if self.loop is None:
+                self.deferred.append((key, job))
+                return
+        loop = self.loop
+
+        def schedule() -> None:
+            loop.call_later(delay, self.dispatch, key, job)
+
+        loop.call_soon_threadsafe(schedule)
+
+    def dispatch(
+        self, key: str, job: Job, done: typing.Optional[typing.Callable] = None
+    ) -> None:
+        queue = self.pending.get(key)
+        if queue is None:
+            queue = self.pending[key] = asyncio.Queue()
+            task = asyncio.ensure_future(self._drain(key, queue))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+        queue.put_nowait((job, done))
+
+    async def _drain(self, key: str, queue: asyncio.Queue) -> None:
+        loop = asyncio.get_running_loop()
+        while not queue.empty():
+            job, done = queue.get_nowait()
+            try:
+                await loop.run_in_executor(self.executor, job)
+            except Exception as e:
+                log.error("Error while handling %s: %s", key, e)
+            finally:
+                if done is not None:
+                    done()
+        del self.pending[key]
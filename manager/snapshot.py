@@ -0,0 +1,30 @@
+import typing
+import json
+
+from threading import Condition
+
+
+class VersionedSnapshot:
+    def __init__(self, build: typing.Callable[[], typing.Any]) -> None:
+        self.build = build
+        self.condition = Condition()
+        self.generation = 0
+        self.body = json.dumps(build())
+
+    def refresh(self) -> None:
+        with self.condition:
+            body = json.dumps(self.build())
+            if body == self.body:
+                return
+            self.body = body
+            self.generation += 1
+            self.condition.notify_all()
+
+    def get(self) -> typing.Tuple[int, str]:
+        with self.condition:
+            return self.generation, self.body
+
+    def wait(self, generation: int, timeout: float) -> typing.Tuple[int, str]:
+        with self.condition:
+            self.condition.wait_for(lambda: self.generation != generation, timeout)
+            return self.generation, self.body
@@ -0,0 +1,80 @@
+import typing
+import re
+
+DOLLAR_TAG = re.compile(r"\$([A-Za-z_][A-Za-z0-9_]*)?\$")
+
+
+def split_statements(script: str) -> typing.List[str]:
+    statements = []
+    start = 0
+    i = 0
+    length = len(script)
+    while i < length:
+        char = script[i]
+        if char == ";":
+            statements.append(script[start:i])
+            start = i + 1
+            i += 1
+        elif char == "'":
+            escaped = i > 0 and script[i - 1] in "eE" and not _is_word(script, i - 2)
+            i = _skip_quoted(script, i, "'", escaped)
+        elif char == '"':
+            i = _skip_quoted(script, i, '"', False)
+        elif script.startswith("--", i):
+            newline = script.find("\n", i)
+            i = length if newline == -1 else newline + 1
+        elif script.startswith("/*", i):
+            i = _skip_block_comment(script, i)
+        elif char == "$" and not _is_word(script, i - 1):
+            match = DOLLAR_TAG.match(script, i)
+            if match:
+                end = script.find(match.group(0), match.end())
+                i = length if end == -1 else end + len(match.group(0))
+            else:
+                i += 1
+        else:
+            i += 1
+    statements.append(script[start:])
+    return [s.strip() for s in statements if _has_content(s)]
+
+
+def _is_word(script: str, index: int) -> bool:
+    return index >= 0 and (script[index].isalnum() or script[index] == "_")
+
+
+def _skip_quoted(script: str, index: int, quote: str, backslash: bool) -> int:
+    i = index + 1
+    while i < len(script):
+        if backslash and script[i] == "\\":
+            i += 2
+            continue
+        if script[i] == quote:
+            if script.startswith(quote, i + 1):
+                i += 2
+                continue
+            return i + 1
+        i += 1
+    return len(script)
+
+
+def _skip_block_comment(script: str, index: int) -> int:
+    depth = 0
+    i = index
+    while i < len(script):
+        if script.startswith("/*", i):
+            depth += 1
+            i += 2
+        elif script.startswith("*/", i):
+            depth -= 1
+            i += 2
+            if not depth:
+                return i
+        else:
+            i += 1
+    return len(script)
+
+
+def _has_content(statement: str) -> bool:
+    stripped = re.sub(r"--[^\n]*", "", statement)
+    stripped = re.sub(r"/\*.*?\*/", "", stripped, flags=re.DOTALL)
+    return bool(stripped.strip())
@@ -0,0 +1,80 @@
+import typing
+import json
+import logging
+import os
+
+from abc import ABC, abstractmethod
+from kubernetes import client
+from kubernetes.client.rest import ApiException
+from env_conf import EnvConf
+
+log = logging.getLogger(__file__)
+
+STATE_KEY = "state.json"
+
+
+class StateStore(ABC):
+    @abstractmethod
+    def load(self) -> typing.Optional[dict]:
+        pass
+
+    @abstractmethod
+    def save(self, state: dict) -> None:
+        pass
+
+
+class FileStateStore(StateStore):
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def load(self) -> typing.Optional[dict]:
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, state: dict) -> None:
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+
+class ConfigMapStateStore(StateStore):
+    def __init__(self, name: str, namespace: str) -> None:
+        self.name = name
+        self.namespace = namespace
+
+    def load(self) -> typing.Optional[dict]:
+        try:
+            config_map = client.CoreV1Api().read_namespaced_config_map(
+                self.name, self.namespace
+            )
+        except ApiException as e:
+            if e.status == 404:
+                return None
+            raise
+        data = (config_map.data or {}).get(STATE_KEY)
+        return json.loads(data) if data else None
+
+    def save(self, state: dict) -> None:
+        body = client.V1ConfigMap(
+            metadata=client.V1ObjectMeta(name=self.name),
+            data={STATE_KEY: json.dumps(state)},
+        )
+        api = client.CoreV1Api()
+        try:
+            api.patch_namespaced_config_map(self.name, self.namespace, body)
+        except ApiException as e:
+            if e.status != 404:
+                raise
+            api.create_namespaced_config_map(self.namespace, body)
+
+
+def create_state_store(conf: EnvConf) -> typing.Optional[StateStore]:
+    if conf.state_config_map:
+        return ConfigMapStateStore(conf.state_config_map, conf.namespace)
+    if conf.state_file:
+        return FileStateStore(conf.state_file)
+    return None
@@ -0,0 +1,66 @@
+import typing
+import re
+
+import jinja2
+from kubernetes.client import V1Pod
+
+ORDINAL = re.compile(r"-(\d+)$")
+QUANTITY = re.compile(r"^([0-9.]+)([A-Za-z]*)$")
+SUFFIXES = {
+    "": 1,
+    "m": 0.001,
+    "k": 10 ** 3,
+    "M": 10 ** 6,
+    "G": 10 ** 9,
+    "T": 10 ** 12,
+    "Ki": 2 ** 10,
+    "Mi": 2 ** 20,
+    "Gi": 2 ** 30,
+    "Ti": 2 ** 40,
+}
+
+# Rendered scripts are SQL, a missing value must fail instead of rendering empty
+ENVIRONMENT = jinja2.Environment(
+    undefined=jinja2.StrictUndefined, keep_trailing_newline=True
+)
+
+
+def parse_quantity(quantity: typing.Union[str, int, float]) -> float:
+    """Converts a kubernetes resource quantity like 512Mi or 250m into a number."""
+    match = QUANTITY.match(str(quantity).strip())
+    if not match or match.group(2) not in SUFFIXES:
+        raise ValueError("Invalid quantity {}".format(quantity))
+    return float(match.group(1)) * SUFFIXES[match.group(2)]
+
+
+ENVIRONMENT.filters["quantity"] = parse_quantity
+
+
+def compile_template(source: str) -> jinja2.Template:
+    return ENVIRONMENT.from_string(source)
+
+
+def pod_ordinal(pod_name: str) -> int:
+    match = ORDINAL.search(pod_name)
+    return int(match.group(1)) if match else 0
+
+
+def pod_context(pod: typing.Optional[V1Pod]) -> typing.Dict[str, typing.Any]:
+    """Metadata of the pod and the resources of its first (database) container."""
+    context: typing.Dict[str, typing.Any] = {
+        "labels": {},
+        "annotations": {},
+        "requests": {},
+        "limits": {},
+    }
+    if pod is None:
+        return context
+    if pod.metadata is not None:
+        context["labels"] = dict(pod.metadata.labels or {})
+        context["annotations"] = dict(pod.metadata.annotations or {})
+    if pod.spec is not None and pod.spec.containers:
+        resources = pod.spec.containers[0].resources
+        if resources is not None:
+            context["requests"] = dict(resources.requests or {})
+            context["limits"] = dict(resources.limits or {})
+    return context
@@ -108,6 +108,13 @@ def _configure_manager_pod_template(manager_conf: dict) -> None:
     template["containers"][0]["env"].append({"name": "NAMESPACE", "value": NAMESPACE})
     template["containers"][0]["env"].append({"name": "MINIMUM_WORKERS", "value": "2"})
     template["containers"][0]["env"].append({"name": "SHORT_URL", "value": "True"})
+    template["containers"][0]["env"].append(
+        {"name": "LEASE_NAME", "value": MANAGER_NAME}
+    )
+    template["containers"][0]["env"].append(
+        {"name": "STATE_CONFIG_MAP", "value": MANAGER_NAME + "-state"}
+    )
+    template["containers"][0]["env"].append({"name": "WEB_HOST", "value": "0.0.0.0"})
 
     template["volumes"][0]["configMap"]["name"] = CONFIG_MAP
 
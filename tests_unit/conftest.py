@@ -0,0 +1,8 @@
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+# The fakes of the benchmark harness stand in for Kubernetes and Postgres
+for directory in ("manager", "benchmark"):
+    sys.path.insert(0, os.path.join(ROOT, directory))
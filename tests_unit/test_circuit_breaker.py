@@ -0,0 +1,59 @@
+import time
+
+import pytest
+
+from circuit_breaker import (
+    CircuitBreaker,
+    CircuitOpenError,
+    RetryBudget,
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+)
+
+
+def test_opens_after_threshold():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=10)
+    for _ in range(2):
+        breaker.failed("master-0")
+        assert breaker.allow("master-0")
+    breaker.failed("master-0")
+    assert breaker.state("master-0") == OPEN
+    assert not breaker.allow("master-0")
+    assert breaker.allow("master-1")
+
+
+def test_half_open_lets_a_single_probe_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.02)
+    breaker.failed("master-0")
+    time.sleep(0.03)
+    assert breaker.allow("master-0")
+    assert breaker.state("master-0") == HALF_OPEN
+    assert not breaker.allow("master-0")
+    breaker.succeeded("master-0")
+    assert breaker.state("master-0") == CLOSED
+    assert breaker.allow("master-0")
+
+
+def test_failed_probe_reopens_for_longer():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.02)
+    breaker.failed("master-0")
+    first = breaker.circuits["master-0"].open_until - time.monotonic()
+    time.sleep(0.03)
+    assert breaker.allow("master-0")
+    breaker.failed("master-0")
+    assert breaker.state("master-0") == OPEN
+    second = breaker.circuits["master-0"].open_until - time.monotonic()
+    assert 0.01 <= second <= 0.04
+    assert first <= 0.02
+    with pytest.raises(CircuitOpenError):
+        breaker.check("master-0")
+
+
+def test_retry_budget_is_shared_and_refills():
+    budget = RetryBudget(2, 100)
+    assert budget.acquire()
+    assert budget.acquire()
+    assert not budget.acquire()
+    time.sleep(0.02)
+    assert budget.acquire()
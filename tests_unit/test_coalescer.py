@@ -0,0 +1,13 @@
+from coalescer import Coalescer
+
+
+def test_flush_passes_the_submit_time_of_the_latest_update():
+    flushed = []
+    coalescer = Coalescer(60, lambda *args: flushed.append(args))
+    coalescer.submit("w-0", "ADD", 1.0)
+    coalescer.submit("w-1", "ADD", 2.0)
+    coalescer.submit("w-0", "REMOVE", 3.0)
+    coalescer.timer.cancel()
+    coalescer.flush()
+    assert flushed == [({"w-1": "ADD", "w-0": "REMOVE"}, {"w-0": 3.0, "w-1": 2.0})]
+    assert coalescer.idle()
@@ -0,0 +1,57 @@
+import copy
+
+import pytest
+
+from drain import ShardMove, ShardMover
+
+
+def test_plan_drain_spreads_shards_over_least_loaded_targets():
+    holders = {1: {"w-0"}, 2: {"w-0"}, 3: {"w-0", "w-1"}, 4: {"w-1"}, 5: {"w-2"}}
+    moves = ShardMover.plan_drain(holders, "w-0", ["w-1", "w-2"])
+    assert moves == [
+        ShardMove(1, "w-0", "w-2"),
+        ShardMove(2, "w-0", "w-1"),
+        ShardMove(3, "w-0", "w-2"),
+    ]
+
+
+def test_plan_drain_skips_shards_without_target():
+    holders = {1: {"w-0", "w-1"}, 2: {"w-1"}}
+    assert ShardMover.plan_drain(holders, "w-0", ["w-1"]) == []
+    assert ShardMover.plan_drain(holders, "w-2", ["w-1"]) == []
+
+
+@pytest.mark.parametrize(
+    "holders,nodes,expected_load",
+    [
+        ({}, ["w-0", "w-1"], {"w-0": 0, "w-1": 0}),
+        (
+            {shard: {"w-0"} for shard in range(6)},
+            ["w-0", "w-1", "w-2"],
+            {"w-0": 2, "w-1": 2, "w-2": 2},
+        ),
+        ({shard: {"w-0"} for shard in range(5)}, ["w-0", "w-1"], {"w-0": 3, "w-1": 2}),
+        ({1: {"w-0", "w-1"}, 2: {"w-0", "w-1"}}, ["w-0", "w-1", "w-2"], None),
+    ],
+)
+def test_plan_rebalance_evens_out_load(holders, nodes, expected_load):
+    original = copy.deepcopy(holders)
+    moves = ShardMover.plan_rebalance(holders, nodes)
+    placed = {shard: set(holding) for shard, holding in holders.items()}
+    for move in moves:
+        assert move.source in placed[move.shard]
+        assert move.target not in placed[move.shard]
+        placed[move.shard] ^= {move.source, move.target}
+    load = ShardMover.load(placed, nodes)
+    if expected_load is not None:
+        assert load == expected_load
+    assert max(load.values()) - min(load.values()) <= 1
+    assert holders == original
+
+
+def test_finished_progress_is_pruned():
+    mover = ShardMover(None, "pg-citus-master", 5432, 1, 10)
+    mover.history = 2
+    for i in range(4):
+        mover.move("m-0", "rebalance {}".format(i), [])
+    assert list(mover.move_progress()) == ["rebalance 2", "rebalance 3"]
@@ -0,0 +1,21 @@
+import pytest
+
+from env_conf import parse_flag
+
+
+@pytest.mark.parametrize(
+    "value,expected",
+    [
+        ("", False),
+        ("false", False),
+        ("False", False),
+        ("0", False),
+        ("no", False),
+        ("1", True),
+        ("true", True),
+        ("True", True),
+        (" yes ", True),
+    ],
+)
+def test_parse_flag(value, expected):
+    assert parse_flag(value) is expected
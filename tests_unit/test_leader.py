@@ -0,0 +1,88 @@
+import time
+
+from fakes import FakeLeaseStore
+from leader import LeaderElector
+
+
+def create_elector(store: FakeLeaseStore, identity: str) -> LeaderElector:
+    return LeaderElector(store, identity, lease_duration=0.3, retry_period=0.05)
+
+
+def test_single_replica_becomes_leader():
+    store = FakeLeaseStore()
+    elector = create_elector(store, "manager-a")
+    elector.step()
+    assert elector.is_leader()
+    assert store.record.holder == "manager-a"
+
+
+def test_standby_waits_while_leader_renews():
+    store = FakeLeaseStore()
+    leader = create_elector(store, "manager-a")
+    standby = create_elector(store, "manager-b")
+    leader.step()
+    for _ in range(10):
+        standby.step()
+        leader.step()
+        time.sleep(0.05)
+    assert leader.is_leader()
+    assert not standby.is_leader()
+    assert standby.holder == "manager-a"
+
+
+def test_standby_takes_over_expired_lease():
+    store = FakeLeaseStore()
+    leader = create_elector(store, "manager-a")
+    standby = create_elector(store, "manager-b")
+    leader.step()
+    standby.step()
+    time.sleep(0.2)
+    standby.step()
+    assert not standby.is_leader()
+    time.sleep(0.2)
+    standby.step()
+    assert standby.is_leader()
+    assert store.record.holder == "manager-b"
+
+
+def test_release_hands_over_immediately():
+    store = FakeLeaseStore()
+    leader = create_elector(store, "manager-a")
+    standby = create_elector(store, "manager-b")
+    started = []
+    standby.on_started = lambda: started.append(time.monotonic())
+    leader.step()
+    standby.step()
+    leader.release()
+    assert not leader.is_leader()
+    standby.step()
+    assert standby.is_leader()
+    assert started
+
+
+def test_leader_steps_down_when_lease_store_is_unavailable():
+    store = FakeLeaseStore()
+    leader = create_elector(store, "manager-a")
+    stopped = []
+    leader.on_stopped = lambda: stopped.append(True)
+    leader.step()
+    store.available = False
+    leader.step()
+    assert leader.is_leader()
+    time.sleep(leader.renew_deadline)
+    leader.step()
+    assert not leader.is_leader()
+    assert stopped
+
+
+def test_only_one_of_many_replicas_leads():
+    store = FakeLeaseStore()
+    electors = [create_elector(store, "manager-{}".format(i)) for i in range(5)]
+    for elector in electors:
+        elector.start()
+    time.sleep(0.5)
+    for elector in electors:
+        elector.stopped.set()
+    time.sleep(0.1)
+    leaders = [elector.identity for elector in electors if elector.is_leader()]
+    assert leaders == [store.record.holder]
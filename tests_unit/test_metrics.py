@@ -0,0 +1,13 @@
+import metrics
+
+
+def test_render_is_empty_when_disabled(monkeypatch):
+    monkeypatch.setattr(metrics, "REGISTRY", [])
+    collected = []
+    metrics.Gauge("test_gauge", "Test gauge", lambda: collected.append(1) or {(): 1})
+    assert "test_gauge 1" in metrics.render()
+
+    monkeypatch.setattr(metrics, "ENABLED", False)
+    collected.clear()
+    assert metrics.render() == ""
+    assert collected == []
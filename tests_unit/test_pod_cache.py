@@ -0,0 +1,99 @@
+import pytest
+import pod_cache
+from fakes import FakeCluster, FakeWatch
+from kubernetes.client.rest import ApiException
+from urllib3.exceptions import ProtocolError
+from pod_cache import EventStats, PodCache, PodInformer
+
+
+class FlakyWatch(FakeWatch):
+    def __init__(self, cluster: FakeCluster, errors: list) -> None:
+        super().__init__(cluster)
+        self.errors = errors
+        self.resource_versions: list = []
+
+    def stream(self, func, namespace, resource_version="", **kwargs):
+        self.resource_versions.append(resource_version)
+        if self.errors:
+            raise self.errors.pop(0)
+        return super().stream(func, namespace, resource_version, **kwargs)
+
+
+def create_informer(cluster: FakeCluster, cache: PodCache) -> PodInformer:
+    return PodInformer(cluster.list_namespaced_pod, "test", cache, EventStats())
+
+
+def events(informer: PodInformer):
+    return [(e["type"], e["object"].metadata.name) for e in informer.relist()]
+
+
+def test_relist_emits_recreated_pod_as_delete_and_add():
+    cluster = FakeCluster(history=1)
+    cache = PodCache(lambda pod: pod.metadata.labels["citusType"])
+    informer = create_informer(cluster, cache)
+    cluster.create_pod("w-0", "citus-worker", ready=True)
+    cluster.create_pod("w-1", "citus-worker", ready=True)
+    assert events(informer) == [("ADDED", "w-0"), ("ADDED", "w-1")]
+
+    cluster.delete_pod("w-0")
+    cluster.create_pod("w-0", "citus-worker", ready=True)
+    cluster.set_ready("w-1", False)
+    assert events(informer) == [
+        ("MODIFIED", "w-1"),
+        ("DELETED", "w-0"),
+        ("ADDED", "w-0"),
+    ]
+    assert cache.get("w-0").metadata.uid == cluster.pods["w-0"].metadata.uid
+
+
+def test_restored_pod_with_new_uid_is_recreated():
+    cluster = FakeCluster()
+    cluster.create_pod("m-0", "citus-master", ready=True)
+    cache = PodCache(lambda pod: pod.metadata.labels["citusType"])
+    cache.restore({"m-0": ("citus-master", "1", "old-uid")})
+    assert events(create_informer(cluster, cache)) == [
+        ("DELETED", "m-0"),
+        ("ADDED", "m-0"),
+    ]
+
+
+def test_restored_cache_is_not_synced_before_the_watch_resumed(monkeypatch):
+    cluster = FakeCluster()
+    monkeypatch.setattr(pod_cache.watch, "Watch", FakeWatch(cluster))
+    cache = PodCache(lambda pod: pod.metadata.labels["citusType"])
+    cache.restore({"m-0": ("citus-master", "1", "")})
+    assert not cache.synced
+    informer = create_informer(cluster, cache)
+    informer.resource_version = "1"
+    informer.resume_timeout = 0.01
+    assert list(informer.watch()) == []
+    assert cache.synced
+
+
+def test_stream_resumes_the_watch_after_transient_errors(monkeypatch):
+    cluster = FakeCluster()
+    errors = [ProtocolError("Connection broken"), ApiException(status=500)]
+    flaky = FlakyWatch(cluster, errors)
+    monkeypatch.setattr(pod_cache.watch, "Watch", flaky)
+    cluster.create_pod("w-0", "citus-worker", ready=True)
+    informer = create_informer(
+        cluster, PodCache(lambda pod: pod.metadata.labels["citusType"])
+    )
+    informer.initial_backoff = informer.maximum_backoff = 0.001
+    stream = informer.stream()
+    assert next(stream)["object"].metadata.name == "w-0"
+    cluster.create_pod("w-1", "citus-worker", ready=True)
+    assert next(stream)["object"].metadata.name == "w-1"
+    assert flaky.resource_versions == ["1", "1", "1"]
+
+
+def test_stream_raises_fatal_errors(monkeypatch):
+    cluster = FakeCluster()
+    monkeypatch.setattr(
+        pod_cache.watch, "Watch", FlakyWatch(cluster, [ApiException(status=403)])
+    )
+    informer = create_informer(
+        cluster, PodCache(lambda pod: pod.metadata.labels["citusType"])
+    )
+    with pytest.raises(ApiException):
+        next(informer.stream())
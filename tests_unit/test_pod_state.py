@@ -0,0 +1,18 @@
+from pod_state import PodStateTable, PENDING, READY
+
+
+def test_reset_lets_ready_pod_become_ready_again():
+    table = PodStateTable()
+    assert table.observe("ADDED", "w-0", True, "citus-worker") == READY
+    assert table.observe("MODIFIED", "w-0", True, "citus-worker") is None
+    assert table.reset("w-0")
+    assert table.snapshot()["w-0"]["state"] == PENDING
+    assert table.pending() == ["w-0"]
+    assert table.observe("MODIFIED", "w-0", True, "citus-worker") == READY
+
+
+def test_reset_ignores_pods_that_are_not_ready():
+    table = PodStateTable()
+    table.observe("ADDED", "w-0", False, "citus-worker")
+    assert not table.reset("w-0")
+    assert not table.reset("w-1")
@@ -0,0 +1,53 @@
+import pytest
+
+from db import BATCH_SEPARATOR, locate_statement
+from sql_script import split_statements
+
+CASES = [
+    ("", []),
+    ("SELECT 1", ["SELECT 1"]),
+    ("SELECT 1;\nSELECT 2;\n", ["SELECT 1", "SELECT 2"]),
+    (";;\n;", []),
+    ("SELECT\n  1\n;", ["SELECT\n  1"]),
+    ("SELECT 'a;b'; SELECT 2", ["SELECT 'a;b'", "SELECT 2"]),
+    ("SELECT 'it''s;'; SELECT 2", ["SELECT 'it''s;'", "SELECT 2"]),
+    ("SELECT E'\\';'; SELECT 2", ["SELECT E'\\';'", "SELECT 2"]),
+    ("SELECT 'a\\'; SELECT 2", ["SELECT 'a\\'", "SELECT 2"]),
+    ('SELECT 1 AS "a;b"; SELECT 2', ['SELECT 1 AS "a;b"', "SELECT 2"]),
+    ("SELECT 1 -- note;\n; SELECT 2", ["SELECT 1 -- note;", "SELECT 2"]),
+    ("SELECT 1 -- note\n; SELECT 2", ["SELECT 1 -- note", "SELECT 2"]),
+    ("-- only a comment;\n", []),
+    ("/* a; /* nested; */ b; */ SELECT 1", ["/* a; /* nested; */ b; */ SELECT 1"]),
+    ("/* comment */;\nSELECT 1", ["SELECT 1"]),
+    (
+        "CREATE FUNCTION f() RETURNS int AS $$ SELECT 1; $$ LANGUAGE sql; SELECT 2",
+        ["CREATE FUNCTION f() RETURNS int AS $$ SELECT 1; $$ LANGUAGE sql", "SELECT 2"],
+    ),
+    (
+        "DO $body$ BEGIN PERFORM '$$;'; END $body$; SELECT 2",
+        ["DO $body$ BEGIN PERFORM '$$;'; END $body$", "SELECT 2"],
+    ),
+    ("SELECT a$b; SELECT 2", ["SELECT a$b", "SELECT 2"]),
+    ("SELECT $1; SELECT 2", ["SELECT $1", "SELECT 2"]),
+    ("SELECT 'unterminated; SELECT 2", ["SELECT 'unterminated; SELECT 2"]),
+]
+
+
+@pytest.mark.parametrize("script,statements", CASES)
+def test_split_statements(script, statements):
+    assert split_statements(script) == statements
+
+
+@pytest.mark.parametrize("script,statements", CASES)
+def test_batch_splits_into_the_same_statements(script, statements):
+    assert split_statements(BATCH_SEPARATOR.join(statements)) == statements
+
+
+def test_locate_statement_in_batch():
+    statements = ["SELECT 1", "SELECT 'a;b' -- comment", "SELECT x"]
+    batch = BATCH_SEPARATOR.join(statements)
+    for index, statement in enumerate(statements):
+        position = str(batch.index(statement) + len(statement))
+        assert locate_statement(statements, position) == index
+    assert locate_statement(statements, str(batch.index(";") + 1)) == -1
+    assert locate_statement(statements, None) == -1
@@ -0,0 +1,132 @@
+from kubernetes.client import (
+    V1Container,
+    V1ObjectMeta,
+    V1Pod,
+    V1PodSpec,
+    V1ResourceRequirements,
+)
+
+from config_monitor import ConfigMonitor, PodMonitorConfig
+from pod_cache import PodCache
+from pod_state import NodeSet
+from templates import parse_quantity, pod_ordinal
+
+TEMPLATE = (
+    "ALTER SYSTEM SET work_mem = '{{ (limits.memory | quantity / 64) | int }}';\n"
+    "SELECT '{{ pod_name }}', {{ ordinal }}, {{ workers | length }};\n"
+)
+
+
+class RecordingDBHandler:
+    def __init__(self) -> None:
+        self.scripts = {}
+
+    def get_host_name(self, pod_name: str, service_name: str) -> str:
+        return "{}.{}".format(pod_name, service_name)
+
+    def execute_script(self, pod_name, service_name, statements, batch=False):
+        self.scripts.setdefault(pod_name, []).append(statements)
+        return []
+
+
+def create_monitor(path: str, workers: NodeSet, limits: dict) -> ConfigMonitor:
+    def get_pod(name):
+        resources = V1ResourceRequirements(limits=limits.get(name, {}))
+        container = V1Container(name="postgres", resources=resources)
+        return V1Pod(spec=V1PodSpec(containers=[container]))
+
+    return ConfigMonitor(
+        RecordingDBHandler(),
+        PodMonitorConfig(NodeSet(), path, "pg-citus-master"),
+        PodMonitorConfig(workers, path, "pg-citus-worker"),
+        templates=True,
+        get_pod=get_pod,
+    )
+
+
+def test_parse_quantity():
+    assert parse_quantity("512Mi") == 512 * 2 ** 20
+    assert parse_quantity("250m") == 0.25
+    assert parse_quantity(2) == 2
+    assert pod_ordinal("citus-worker-12") == 12
+
+
+def write_template(tmp_path) -> str:
+    path = tmp_path / "worker.setup"
+    path.write_text(TEMPLATE)
+    return str(path)
+
+
+def test_renders_per_node_and_reprovisions_changed_nodes(tmp_path):
+    workers = NodeSet()
+    workers.update(["citus-worker-0", "citus-worker-1"])
+    limits = {name: {"memory": "64Mi"} for name in workers.snapshot()}
+    monitor = create_monitor(write_template(tmp_path), workers, limits)
+
+    summary = monitor.update_workers()
+    scripts = monitor.db_handler.scripts
+    assert summary.succeeded == ["citus-worker-0", "citus-worker-1"]
+    assert scripts["citus-worker-1"][0] == [
+        "ALTER SYSTEM SET work_mem = '1048576'",
+        "SELECT 'citus-worker-1', 1, 2",
+    ]
+
+    limits["citus-worker-1"] = {"memory": "128Mi"}
+    summary = monitor.update_workers()
+    assert summary.succeeded == ["citus-worker-1"]
+    assert len(scripts["citus-worker-0"]) == 1
+    assert len(scripts["citus-worker-1"]) == 2
+
+
+def test_render_error_fails_only_that_node(tmp_path):
+    workers = NodeSet()
+    workers.update(["citus-worker-0", "citus-worker-1"])
+    limits = {"citus-worker-0": {"memory": "1Gi"}}
+    monitor = create_monitor(write_template(tmp_path), workers, limits)
+
+    summary = monitor.update_workers()
+    assert summary.succeeded == ["citus-worker-0"]
+    assert summary.failed == ["citus-worker-1"]
+    assert monitor.ledger.snapshot()["citus-worker-1"]["outcome"] == "failed"
+
+
+def test_restored_pods_are_read_before_rendering(tmp_path):
+    def read_pod(name):
+        metadata = V1ObjectMeta(
+            name=name,
+            labels={"citusType": "citus-worker"},
+            resource_version="7",
+            uid="uid-" + name,
+        )
+        resources = V1ResourceRequirements(limits={"memory": "64Mi"})
+        container = V1Container(name="postgres", resources=resources)
+        return V1Pod(metadata=metadata, spec=V1PodSpec(containers=[container]))
+
+    cache = PodCache(lambda pod: pod.metadata.labels["citusType"], read_pod)
+    cache.restore({"citus-worker-0": ("citus-worker", "5", "uid-citus-worker-0")})
+    workers = NodeSet()
+    workers.update(["citus-worker-0"])
+    monitor = create_monitor(write_template(tmp_path), workers, {})
+    monitor.get_pod = cache.lookup
+
+    assert monitor.update_workers().succeeded == ["citus-worker-0"]
+    statements = monitor.db_handler.scripts["citus-worker-0"][0]
+    assert statements[0] == "ALTER SYSTEM SET work_mem = '1048576'"
+    pod = cache.get("citus-worker-0")
+    assert pod.spec is not None
+    # The watch still has to deliver changes after the restored version
+    assert pod.metadata.resource_version == "5"
+    assert cache.lookup("citus-worker-0") is pod
+
+
+def test_events_replace_restored_pods_of_the_same_version():
+    cache = PodCache(lambda pod: pod.metadata.labels["citusType"])
+    cache.restore({"citus-worker-0": ("citus-worker", "5", "")})
+    metadata = V1ObjectMeta(
+        name="citus-worker-0",
+        labels={"citusType": "citus-worker"},
+        resource_version="5",
+    )
+    pod = V1Pod(metadata=metadata, spec=V1PodSpec(containers=[]))
+    assert not cache.apply("MODIFIED", pod)
+    assert cache.get("citus-worker-0") is pod